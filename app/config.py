@@ -24,6 +24,13 @@ class Settings(BaseSettings):
     # SUNAT & Verificación
     sunat_ruc_api: str = "https://www3.sunat.gob.pe/cl-ti-itmrconsruc"
     minem_portal: str = "https://www.gob.pe/minem"
+    sunat_timeout_seconds: float = 10
+    sunat_verify_concurrency: int = 20  # consultas simultáneas (y conexiones del pool) a SUNAT
+    verification_ttl_hours: int = 168  # verificaciones más recientes se sirven desde BD
+    reverify_batch_size: int = 200  # compradores por ejecución de la re-verificación programada
+    reverify_rate_per_second: float = 2  # consultas por segundo a SUNAT en segundo plano
+    buyer_nearby_max_radius_km: float = 2000  # radio máximo aceptado por /buyers/nearby
+    buyer_changes_lag_seconds: int = 5  # /buyers/changes omite escrituras más recientes (aún pueden estar en curso)
     
     # Logging
     log_level: str = "INFO"
@@ -37,6 +44,28 @@ class Settings(BaseSettings):
     # Scraping
     scraping_timeout: int = 30
     scraping_retries: int = 3
+
+    # Precios
+    price_cache_ttl_seconds: int = 60  # recarga desde BD para ver escrituras de otros procesos
+    bcrp_timeout_seconds: float = 10
+    metals_timeout_seconds: float = 10
+    price_refresh_min_interval_seconds: int = 60  # /prices/refresh dentro de esta ventana no consulta fuentes
+    price_stream_poll_seconds: float = 5  # /prices/stream consulta BD por escrituras de otros procesos (0 = desactivado)
+    tick_store_capacity: int = 4096  # ticks recientes en memoria por commodity (0 = desactivado)
+    alert_rules_ttl_seconds: int = 60  # recarga de reglas de alerta creadas en otros procesos
+
+    # Retención de precios (días; los agregados 1d se conservan siempre)
+    price_raw_retention_days: int = 90
+    price_minute_rollup_retention_days: int = 90
+    price_hourly_rollup_retention_days: int = 730
+    price_compaction_batch_size: int = 5000
+
+    # Presupuestos
+    quote_cache_size: int = 10000  # cotizaciones de /budgets/generate en memoria (LRU; 0 = desactivado)
+
+    # Celery
+    celery_broker_url: str = "redis://localhost:6379/0"
+    celery_result_backend: str = "redis://localhost:6379/0"
     
     class Config:
         env_file = ".env"
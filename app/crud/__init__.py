@@ -1,3 +1,3 @@
-from . import buyer, price
+from . import buyer, price, alert, budget, buyer_search, buyer_geo
 
-__all__ = ["buyer", "price"]
+__all__ = ["buyer", "price", "alert", "budget", "buyer_search", "buyer_geo"]
@@ -0,0 +1,79 @@
+from datetime import datetime
+from sqlalchemy import update, insert, select, desc, or_
+from sqlalchemy.orm import Session
+from app.models.alert import PriceAlert, PriceAlertEvent
+from app.schemas.alert import PriceAlertCreate
+
+def create_alert(db: Session, alert: PriceAlertCreate):
+    db_alert = PriceAlert(**alert.dict())
+    db.add(db_alert)
+    db.commit()
+    db.refresh(db_alert)
+    return db_alert
+
+def get_alerts(db: Session, active_only: bool = False):
+    query = db.query(PriceAlert)
+    if active_only:
+        query = query.filter(PriceAlert.active.is_(True))
+    return query.order_by(PriceAlert.id).all()
+
+def get_active_alerts(db: Session):
+    return get_alerts(db, active_only=True)
+
+def deactivate_alert(db: Session, alert_id: int):
+    db_alert = db.query(PriceAlert).filter(PriceAlert.id == alert_id).first()
+    if db_alert:
+        db_alert.active = False
+        db.commit()
+        db.refresh(db_alert)
+    return db_alert
+
+ALERT_EVENT_FIELDS = (
+    "id", "alert_id", "name", "commodity", "kind", "threshold", "window_minutes",
+    "observed", "price", "triggered_at",
+)
+
+def record_alert_events(db: Session, events: list) -> list:
+    """
+    Registra disparos de reglas (dicts con ALERT_EVENT_FIELDS salvo id) y su
+    last_triggered_at en una transacción. Devuelve los ids en el orden de 'events'.
+    """
+    if not events:
+        return []
+    ids = db.execute(
+        insert(PriceAlertEvent).returning(PriceAlertEvent.id, sort_by_parameter_order=True),
+        [{name: event[name] for name in ALERT_EVENT_FIELDS if name != "id"} for event in events],
+    ).scalars().all()
+    last_triggered = {}
+    for event in events:
+        current = last_triggered.get(event["alert_id"])
+        if current is None or event["triggered_at"] > current:
+            last_triggered[event["alert_id"]] = event["triggered_at"]
+    for alert_id, triggered_at in last_triggered.items():
+        # Solo avanza: un disparo tardío de otro proceso no retrocede la fecha
+        db.execute(
+            update(PriceAlert)
+            .where(
+                PriceAlert.id == alert_id,
+                or_(PriceAlert.last_triggered_at.is_(None), PriceAlert.last_triggered_at < triggered_at),
+            )
+            .values(last_triggered_at=triggered_at)
+        )
+    db.commit()
+    return list(ids)
+
+def get_alert_events(db: Session, after_id: int = None, limit: int = 200) -> list:
+    """
+    Disparos registrados: los más recientes primero o, con 'after_id', los
+    posteriores a ese id en orden de registro (para seguir la tabla).
+    """
+    query = select(*(getattr(PriceAlertEvent, name) for name in ALERT_EVENT_FIELDS)).limit(limit)
+    if after_id is None:
+        query = query.order_by(desc(PriceAlertEvent.id))
+    else:
+        query = query.where(PriceAlertEvent.id > after_id).order_by(PriceAlertEvent.id)
+    return [dict(row) for row in db.execute(query).mappings()]
+
+def get_last_alert_event_id(db: Session) -> int:
+    latest = get_alert_events(db, limit=1)
+    return latest[0]["id"] if latest else 0
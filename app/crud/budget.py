@@ -0,0 +1,64 @@
+import json
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, tuple_
+from app.models.budget import Budget, BUDGET_SUMMARY_COLUMNS
+
+# Columnas devueltas por el listado (cubiertas por los índices de budgets)
+_LIST_COLUMNS = ["id", "buyer_id", "mineral_type", "created_at"] + BUDGET_SUMMARY_COLUMNS
+
+
+def _row(fields: dict, created_at: datetime) -> dict:
+    row = dict(fields)
+    if isinstance(row.get("details_json"), dict):
+        row["details_json"] = json.dumps(row["details_json"], default=str)
+    row.setdefault("created_at", created_at)
+    return row
+
+
+def create_budget(db: Session, **fields) -> Budget:
+    """Persiste un presupuesto. details_json acepta un dict (se serializa)."""
+    db_budget = Budget(**_row(fields, datetime.utcnow()))
+    db.add(db_budget)
+    db.commit()
+    db.refresh(db_budget)
+    return db_budget
+
+
+def create_budgets_bulk(db: Session, rows: list) -> list:
+    """
+    Inserta muchos presupuestos en un solo executemany y un commit.
+    Devuelve los ids en el mismo orden que 'rows'.
+    """
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    ids = db.execute(
+        insert(Budget).returning(Budget.id, sort_by_parameter_order=True),
+        [_row(fields, now) for fields in rows],
+    ).scalars().all()
+    db.commit()
+    return list(ids)
+
+
+def get_budget(db: Session, budget_id: int):
+    return db.query(Budget).filter(Budget.id == budget_id).first()
+
+
+def get_budgets_page(db: Session, buyer_id: int = None, mineral_type: str = None, after: tuple = None, limit: int = 50):
+    """
+    Página del historial en orden (created_at, id) descendente.
+    'after' es la clave (created_at, id) de la última fila de la página anterior:
+    la consulta es un seek sobre el índice, su costo no crece con la profundidad.
+    Devuelve las filas (solo columnas de resumen) y si hay más páginas.
+    """
+    query = select(*(getattr(Budget, name) for name in _LIST_COLUMNS))
+    if buyer_id is not None:
+        query = query.where(Budget.buyer_id == buyer_id)
+    if mineral_type is not None:
+        query = query.where(Budget.mineral_type == mineral_type)
+    if after is not None:
+        query = query.where(tuple_(Budget.created_at, Budget.id) < tuple_(*after))
+    query = query.order_by(Budget.created_at.desc(), Budget.id.desc()).limit(limit + 1)
+    rows = db.execute(query).mappings().all()
+    return rows[:limit], len(rows) > limit
@@ -1,3 +1,10 @@
+import json
+from pydantic import ValidationError
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from app.models.buyer import Buyer, BuyerStatus
 from app.schemas.buyer import BuyerCreate
@@ -5,9 +12,37 @@ from app.schemas.buyer import BuyerCreate
 def get_buyer_by_ruc(db: Session, ruc: str):
     return db.query(Buyer).filter(Buyer.ruc == ruc).first()
 
+def get_existing_buyer_ids(db: Session, buyer_ids) -> set:
+    """Subconjunto de ids que existen, en una sola consulta."""
+    ids = {buyer_id for buyer_id in buyer_ids if buyer_id is not None}
+    if not ids:
+        return set()
+    return {row[0] for row in db.query(Buyer.id).filter(Buyer.id.in_(ids))}
+
+# Columnas del listado por defecto (las de BuyerResponse)
+BUYER_LIST_FIELDS = (
+    "id", "ruc", "name", "address", "phone", "email", "website", "classification",
+    "certificates", "status", "verification_date", "risk_notes", "created_at",
+    "latitude", "longitude",
+)
+
 def get_buyers(db: Session, skip: int = 0, limit: int = 10):
     return db.query(Buyer).offset(skip).limit(limit).all()
 
+def get_buyers_page(db: Session, fields=BUYER_LIST_FIELDS, after_id: int = None, skip: int = 0, limit: int = 10):
+    """
+    Página del listado en orden de id, cargando solo las columnas pedidas.
+    Con 'after_id' (keyset) la consulta es un seek sobre la clave primaria;
+    'skip' (OFFSET) se mantiene por compatibilidad. Devuelve (filas, hay_más).
+    """
+    query = select(*(getattr(Buyer, name) for name in fields)).order_by(Buyer.id).limit(limit + 1)
+    if after_id is not None:
+        query = query.where(Buyer.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    rows = db.execute(query).mappings().all()
+    return rows[:limit], len(rows) > limit
+
 def create_buyer(db: Session, buyer: BuyerCreate):
     db_buyer = Buyer(**buyer.dict())
     db.add(db_buyer)
@@ -19,11 +54,176 @@ def update_buyer_status(db: Session, buyer_id: int, status: BuyerStatus, risk_no
     db_buyer = db.query(Buyer).filter(Buyer.id == buyer_id).first()
     if db_buyer:
         db_buyer.status = status
+        db_buyer.verification_date = datetime.utcnow()
         if risk_notes:
             db_buyer.risk_notes = risk_notes
         db.commit()
         db.refresh(db_buyer)
     return db_buyer
 
+def get_buyers_to_verify(db: Session, ids: list = None, status: BuyerStatus = None, limit: int = None) -> list:
+    """(id, ruc) de los compradores seleccionados por ids y/o estado, en orden de id."""
+    query = select(Buyer.id, Buyer.ruc).where(Buyer.ruc.is_not(None)).order_by(Buyer.id)
+    if ids is not None:
+        query = query.where(Buyer.id.in_(ids))
+    if status is not None:
+        query = query.where(Buyer.status == status)
+    if limit is not None:
+        query = query.limit(limit)
+    return [tuple(row) for row in db.execute(query)]
+
+def is_verification_fresh(db_buyer: Buyer, ttl: timedelta) -> bool:
+    """
+    True si el estado viene de una verificación hecha dentro del TTL. Los
+    errores de conexión con SUNAT no se guardan, así verification_date solo
+    fecha respuestas de SUNAT.
+    """
+    return (
+        db_buyer.verification_date is not None
+        and db_buyer.status in (BuyerStatus.VERIFIED, BuyerStatus.SUSPICIOUS)
+        and datetime.utcnow() - db_buyer.verification_date < ttl
+    )
+
+def get_stale_buyers(db: Session, verified_before: datetime, limit: int) -> list:
+    """
+    (id, ruc) de los compradores a re-verificar, los más antiguos primero:
+    primero los nunca verificados y luego por verification_date ascendente.
+    Son dos consultas para que ambas usen índices (NULLS FIRST no es indexable en SQLite).
+    """
+    never = db.execute(
+        select(Buyer.id, Buyer.ruc)
+        .where(Buyer.verification_date.is_(None), Buyer.ruc.is_not(None))
+        .order_by(Buyer.id)
+        .limit(limit)
+    ).all()
+    stale = []
+    if len(never) < limit:
+        stale = db.execute(
+            select(Buyer.id, Buyer.ruc)
+            .where(Buyer.verification_date < verified_before, Buyer.ruc.is_not(None))
+            .order_by(Buyer.verification_date, Buyer.id)
+            .limit(limit - len(never))
+        ).all()
+    return [tuple(row) for row in list(never) + list(stale)]
+
+def update_buyer_statuses_bulk(db: Session, updates: list) -> int:
+    """
+    Aplica resultados de verificación en un solo executemany (UPDATE por id).
+    Cada elemento: {"id", "status", "risk_notes"}; risk_notes None no borra la nota previa.
+    """
+    if not updates:
+        return 0
+    now = datetime.utcnow()
+    with_notes = [{**item, "verification_date": now, "updated_at": now} for item in updates if item.get("risk_notes")]
+    without_notes = [
+        {"id": item["id"], "status": item["status"], "verification_date": now, "updated_at": now}
+        for item in updates if not item.get("risk_notes")
+    ]
+    # Dos grupos con las mismas columnas: cada uno es un solo UPDATE ejecutado por lote
+    for rows in (with_notes, without_notes):
+        if rows:
+            db.execute(update(Buyer), rows)
+    db.commit()
+    return len(updates)
+
+def normalize_buyer_timestamps(engine: Engine):
+    """
+    SQLite: completa con microsegundos las fechas escritas por CURRENT_TIMESTAMP
+    ('YYYY-MM-DD HH:MM:SS') para que ordenen y comparen igual que las de
+    SQLAlchemy ('YYYY-MM-DD HH:MM:SS.ffffff'). Idempotente.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for column in ("created_at", "updated_at"):
+            conn.execute(text(f"UPDATE buyers SET {column} = {column} || '.000000' WHERE length({column}) = 19"))
+
+def get_buyer_changes(db: Session, after: tuple = None, limit: int = 500, lag_seconds: int = 5):
+    """
+    Compradores insertados o modificados después de la clave (updated_at, id)
+    'after', en ese orden. Se omiten los de los últimos 'lag_seconds' (reloj
+    UTC de la aplicación, el mismo que fija updated_at): updated_at se fija al
+    escribir pero la fila se ve al hacer commit, y sin ese margen el cursor
+    podría pasar por delante de transacciones en curso.
+    Devuelve (filas, hay_más).
+    """
+    settled_before = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    columns = [getattr(Buyer, name) for name in BUYER_LIST_FIELDS] + [Buyer.updated_at]
+    query = select(*columns).where(Buyer.updated_at < settled_before)
+    if after is not None:
+        query = query.where(tuple_(Buyer.updated_at, Buyer.id) > tuple_(*after))
+    query = query.order_by(Buyer.updated_at, Buyer.id).limit(limit + 1)
+    rows = db.execute(query).mappings().all()
+    return rows[:limit], len(rows) > limit
+
 def get_verified_buyers(db: Session):
     return db.query(Buyer).filter(Buyer.status == BuyerStatus.VERIFIED).all()
+
+# Campos que carga /buyers/import (los de BuyerCreate)
+BUYER_IMPORT_FIELDS = tuple(BuyerCreate.model_fields)
+
+def parse_buyer_records(records: list, first_row: int = 1):
+    """
+    Valida registros de importación contra BuyerCreate: dicts (filas CSV) o
+    líneas JSON (NDJSON). Devuelve (filas válidas como (n° de fila, dict),
+    errores) sin abortar por filas inválidas.
+    """
+    valid, errors = [], []
+    for offset, record in enumerate(records):
+        row_number = first_row + offset
+        try:
+            if isinstance(record, str):
+                record = json.loads(record)
+            if not isinstance(record, dict):
+                raise ValueError("Se esperaba un objeto")
+            # En CSV una celda vacía equivale a campo ausente
+            data = {key: value for key, value in record.items() if key in BUYER_IMPORT_FIELDS and value not in ("", None)}
+            buyer = BuyerCreate(**data)
+            ruc = buyer.ruc.strip()
+            if len(ruc) != 11 or not ruc.isdigit():
+                raise ValueError(f"RUC no válido: {buyer.ruc}")
+            valid.append((row_number, {**buyer.model_dump(), "ruc": ruc}))
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )})
+        except (TypeError, ValueError) as e:
+            errors.append({"row": row_number, "error": str(e)})
+    return valid, errors
+
+def get_existing_rucs(db: Session, rucs) -> set:
+    """RUCs que ya existen, en una sola consulta."""
+    rucs = set(rucs)
+    if not rucs:
+        return set()
+    return {row[0] for row in db.execute(select(Buyer.ruc).where(Buyer.ruc.in_(rucs)))}
+
+def upsert_buyers(db: Session, rows: list, update_existing: bool = True):
+    """
+    Inserta compradores en un solo INSERT ... ON CONFLICT (ruc) por lote.
+    Con update_existing los existentes actualizan sus datos de contacto (no el
+    estado de verificación); si no, se dejan como están. Un campo ausente en
+    la fila (None) conserva el valor guardado.
+    """
+    if not rows:
+        return
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(Buyer)
+    if update_existing:
+        # Todas las filas del lote llevan las mismas columnas: la ausencia llega
+        # como None y coalesce evita que borre lo guardado.
+        # onupdate no aplica en ON CONFLICT: updated_at se fija explícitamente
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Buyer.ruc],
+            set_={
+                **{
+                    name: func.coalesce(stmt.excluded[name], getattr(Buyer, name))
+                    for name in BUYER_IMPORT_FIELDS if name != "ruc"
+                },
+                "updated_at": datetime.utcnow(),
+            },
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Buyer.ruc])
+    db.execute(stmt, rows)
+    db.commit()
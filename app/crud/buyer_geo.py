@@ -0,0 +1,164 @@
+"""
+Búsqueda de compradores cercanos a un punto (p.ej. una mina) por latitud/longitud.
+
+- SQLite: tabla virtual R*Tree buyers_geo (un rectángulo degenerado por
+  comprador), mantenida por triggers sobre latitude/longitude.
+- Postgres: índice GiST sobre point(longitude, latitude) (tipos geométricos
+  nativos, sin requerir PostGIS).
+
+La consulta k-NN recorre cajas crecientes alrededor del punto: cada caja es
+un rango sobre el índice y solo sus candidatos se miden con haversine. En
+cuanto hay k compradores dentro del radio de la caja, esos son los k más
+cercanos, así el costo depende de la densidad local y no del tamaño del
+directorio.
+"""
+
+import math
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.models.buyer import BuyerStatus
+from app.utils.logger import logger
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 110.574
+
+# Radio de la primera caja (km); se duplica hasta cubrir el radio pedido
+INITIAL_SEARCH_KM = 10.0
+
+# Columnas devueltas por la búsqueda
+RESULT_FIELDS = ("id", "ruc", "name", "classification", "address", "status", "latitude", "longitude")
+
+_SQLITE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS buyers_geo_ai AFTER INSERT ON buyers
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO buyers_geo VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS buyers_geo_ad AFTER DELETE ON buyers BEGIN
+        DELETE FROM buyers_geo WHERE id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS buyers_geo_au AFTER UPDATE OF latitude, longitude ON buyers BEGIN
+        DELETE FROM buyers_geo WHERE id = old.id;
+        INSERT INTO buyers_geo SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END""",
+]
+
+
+def _ensure_columns(engine: Engine):
+    # create_all no altera tablas existentes: agrega las columnas (nulables) si faltan
+    existing = {column["name"] for column in inspect(engine).get_columns("buyers")}
+    with engine.begin() as conn:
+        for name in ("latitude", "longitude"):
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE buyers ADD COLUMN {name} FLOAT"))
+
+
+def ensure_geo_index(engine: Engine):
+    """Crea el índice espacial y su sincronización si no existen (idempotente)."""
+    try:
+        _ensure_columns(engine)
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'buyers_geo'")).first()
+                if not exists:
+                    conn.execute(text("CREATE VIRTUAL TABLE buyers_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)"))
+                for ddl in _SQLITE_DDL:
+                    conn.execute(text(ddl))
+                if not exists:
+                    # Indexa los compradores que ya tenían ubicación
+                    conn.execute(text(
+                        "INSERT INTO buyers_geo SELECT id, latitude, latitude, longitude, longitude "
+                        "FROM buyers WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+                    ))
+        elif engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_buyers_location_gist ON buyers USING gist (point(longitude, latitude))"
+                ))
+    except Exception as e:
+        # Sin R*Tree (SQLite compilado sin él): /buyers/nearby filtra por rango de columnas
+        logger.warning(f"Buyer geo index not available: {str(e)}")
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia de gran círculo en km."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """Caja (min_lat, max_lat, min_lon, max_lon) que contiene el círculo de radio radius_km."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    # Cerca de los polos el grado de longitud se anula: la caja cubre todas las longitudes
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    if cos_lat <= 1e-6 or radius_km / (KM_PER_DEGREE_LAT * cos_lat) >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    # Sin manejo del antimeridiano (fuera del ámbito del directorio)
+    return min_lat, max_lat, max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def _box_candidates(db: Session, box, status, use_index: bool):
+    columns = ", ".join(f"b.{field}" for field in RESULT_FIELDS)
+    status_filter = "AND b.status = :status" if status is not None else ""
+    params = dict(zip(("min_lat", "max_lat", "min_lon", "max_lon"), box))
+    params["status"] = status.name if status is not None else None
+    dialect = db.get_bind().dialect.name
+    if use_index and dialect == "sqlite":
+        sql = (
+            f"SELECT {columns} FROM buyers_geo g JOIN buyers b ON b.id = g.id "
+            "WHERE g.max_lat >= :min_lat AND g.min_lat <= :max_lat "
+            f"AND g.max_lon >= :min_lon AND g.min_lon <= :max_lon {status_filter}"
+        )
+    elif use_index and dialect == "postgresql":
+        sql = (
+            f"SELECT {columns} FROM buyers b "
+            "WHERE point(b.longitude, b.latitude) <@ box(point(:min_lon, :min_lat), point(:max_lon, :max_lat)) "
+            f"{status_filter}"
+        )
+    else:
+        sql = (
+            f"SELECT {columns} FROM buyers b "
+            "WHERE b.latitude BETWEEN :min_lat AND :max_lat "
+            f"AND b.longitude BETWEEN :min_lon AND :max_lon {status_filter}"
+        )
+    return db.execute(text(sql), params).mappings().all()
+
+
+def find_nearby_buyers(db: Session, lat: float, lon: float, radius_km: float, limit: int = 20, status=None) -> list:
+    """
+    Los 'limit' compradores más cercanos a (lat, lon) dentro de radius_km,
+    ordenados por distancia (dicts con RESULT_FIELDS y 'distance_km').
+    """
+    use_index = True
+    search_km = min(INITIAL_SEARCH_KM, radius_km)
+    while True:
+        box = bounding_box(lat, lon, search_km)
+        try:
+            rows = _box_candidates(db, box, status, use_index)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Buyer geo index unavailable, falling back to column range: {str(e)}")
+            use_index = False
+            rows = _box_candidates(db, box, status, use_index)
+
+        found = []
+        for row in rows:
+            distance = haversine_km(lat, lon, row["latitude"], row["longitude"])
+            # Solo es definitivo lo que cae dentro del círculo inscrito en la caja
+            if distance <= search_km:
+                item = dict(row)
+                # SQL textual devuelve el nombre del enum tal como se almacena
+                if item["status"] in BuyerStatus.__members__:
+                    item["status"] = BuyerStatus[item["status"]].value
+                item["distance_km"] = round(distance, 3)
+                found.append(item)
+        if len(found) >= limit or search_km >= radius_km:
+            found.sort(key=lambda item: (item["distance_km"], item["id"]))
+            return found[:limit]
+        search_km = min(search_km * 2, radius_km)
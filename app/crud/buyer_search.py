@@ -0,0 +1,263 @@
+"""
+Búsqueda difusa de compradores sobre name, address, classification y certificates.
+
+- SQLite: tabla FTS5 externa (content=buyers) con tokenizer trigram, mantenida
+  por triggers. Primero se buscan las palabras como subcadenas; si no basta,
+  subcadenas largas o pares de trigramas de cada palabra (primero todas las
+  palabras, luego alguna), que la palabra correcta conserva aunque la
+  buscada tenga un error. El índice ordena por bm25 y los mejores candidatos
+  se reordenan por similitud de trigramas.
+- Postgres: índice GIN pg_trgm sobre la concatenación de los campos (se
+  mantiene solo) y word_similarity para filtrar y ordenar.
+"""
+
+import itertools
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.models.buyer import BuyerStatus
+from app.utils.logger import logger
+
+SEARCH_FIELDS = ("name", "address", "classification", "certificates")
+
+# Peso de cada campo en el puntaje (el nombre domina)
+FIELD_WEIGHTS = {"name": 1.0, "classification": 0.8, "address": 0.6, "certificates": 0.6}
+
+# Columnas devueltas por la búsqueda
+RESULT_FIELDS = ("id", "ruc", "name", "classification", "address", "status")
+
+# Candidatos por resultado pedido que se reordenan en SQLite
+CANDIDATE_FACTOR = 5
+
+# Máximo de cláusulas (subcadenas o pares de trigramas) por consulta FTS difusa
+MAX_QUERY_CLAUSES = 64
+
+# Mejores coincidencias (bm25) de cada nivel difuso que se reordenan por similitud
+FUZZY_CANDIDATES = 500
+
+# Similitud mínima (0-1) para considerar un resultado
+MIN_SCORE = 0.3
+
+_PG_SEARCH_EXPR = " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+
+_SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS buyers_fts_ai AFTER INSERT ON buyers BEGIN
+        INSERT INTO buyers_fts(rowid, {', '.join(SEARCH_FIELDS)})
+        VALUES (new.id, {', '.join('new.' + f for f in SEARCH_FIELDS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS buyers_fts_ad AFTER DELETE ON buyers BEGIN
+        INSERT INTO buyers_fts(buyers_fts, rowid, {', '.join(SEARCH_FIELDS)})
+        VALUES ('delete', old.id, {', '.join('old.' + f for f in SEARCH_FIELDS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS buyers_fts_au AFTER UPDATE OF {', '.join(SEARCH_FIELDS)} ON buyers BEGIN
+        INSERT INTO buyers_fts(buyers_fts, rowid, {', '.join(SEARCH_FIELDS)})
+        VALUES ('delete', old.id, {', '.join('old.' + f for f in SEARCH_FIELDS)});
+        INSERT INTO buyers_fts(rowid, {', '.join(SEARCH_FIELDS)})
+        VALUES (new.id, {', '.join('new.' + f for f in SEARCH_FIELDS)});
+    END""",
+]
+
+
+def ensure_search_index(engine: Engine):
+    """Crea el índice de búsqueda y su sincronización si no existen (idempotente)."""
+    try:
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'buyers_fts'")).first()
+                if not exists:
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE buyers_fts USING fts5({', '.join(SEARCH_FIELDS)}, "
+                        "content='buyers', content_rowid='id', tokenize='trigram')"
+                    ))
+                for ddl in _SQLITE_DDL:
+                    conn.execute(text(ddl))
+                if not exists:
+                    # Indexa los compradores que ya existían
+                    conn.execute(text("INSERT INTO buyers_fts(buyers_fts) VALUES ('rebuild')"))
+        elif engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_buyers_search_trgm ON buyers USING gin (({_PG_SEARCH_EXPR}) gin_trgm_ops)"
+                ))
+    except Exception as e:
+        # Sin FTS5/trigram o sin permiso para la extensión: /buyers/search usa LIKE
+        logger.warning(f"Buyer search index not available: {str(e)}")
+
+
+def trigrams(value: str) -> set:
+    """Trigramas por palabra al estilo pg_trgm (minúsculas, palabra con bordes)."""
+    result = set()
+    for word in "".join(c if c.isalnum() else " " for c in (value or "").lower()).split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(query_trigrams: set, value: str) -> float:
+    """Fracción de los trigramas de la consulta presentes en el campo (≈ word_similarity)."""
+    if not query_trigrams or not value:
+        return 0.0
+    return len(query_trigrams & trigrams(value)) / len(query_trigrams)
+
+
+def score_row(query_trigrams: set, row) -> float:
+    return max(FIELD_WEIGHTS[field] * similarity(query_trigrams, row[field]) for field in SEARCH_FIELDS)
+
+
+def _words(q: str) -> list:
+    return [word for word in "".join(c if c.isalnum() else " " for c in q.lower()).split() if len(word) >= 3]
+
+
+def _quote_fts(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _escape_like(value: str) -> str:
+    # '%' y '_' de la consulta son literales (LIKE ... ESCAPE '\')
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_exact_query(q: str) -> str:
+    # Cada palabra como subcadena (con trigram, una frase = búsqueda de subcadena)
+    return " AND ".join(_quote_fts(word) for word in _words(q))
+
+
+def _fuzzy_word_clauses(word: str) -> list:
+    """
+    Cláusulas que cumple la palabra correcta aunque la buscada tenga un error.
+    Un error de tipeo deja intacto un prefijo o un sufijo de al menos la mitad
+    de la palabra: en palabras largas se buscan sus subcadenas de ese largo
+    (frases de trigramas consecutivos, muy selectivas). En las cortas, pares
+    de trigramas: destruye a lo sumo tres consecutivos, así la correcta aún
+    cumple algún par, y un trigrama común suelto ("min") no basta. Con cinco
+    o más trigramas alcanza con (primero, segundo), (penúltimo, último) y
+    (primero, último): menos frases que puntuar por fila.
+    """
+    size = len(word) // 2
+    if size >= 4:
+        return [_quote_fts(part) for part in dict.fromkeys(word[i:i + size] for i in range(len(word) - size + 1))]
+    # Trigramas internos (sin bordes): es lo que indexa el tokenizer trigram de FTS5
+    grams = list(dict.fromkeys(word[i:i + 3] for i in range(len(word) - 2)))
+    if len(grams) == 1:
+        return [_quote_fts(grams[0])]
+    if len(grams) >= 5:
+        pairs = [(grams[0], grams[1]), (grams[-2], grams[-1]), (grams[0], grams[-1])]
+    else:
+        pairs = itertools.combinations(grams, 2)
+    return [f"({_quote_fts(a)} AND {_quote_fts(b)})" for a, b in pairs]
+
+
+def _fts_fuzzy_queries(q: str) -> list:
+    """
+    Consultas difusas de la más a la menos estricta: primero cada palabra debe
+    coincidir (AND de los OR de sus pares), luego basta con alguna (OR de todo).
+    Cada una acotada a MAX_QUERY_CLAUSES pares.
+    """
+    words = list(dict.fromkeys(_words(q)))
+    per_word = max(1, MAX_QUERY_CLAUSES // len(words))
+    any_word = " OR ".join(list(dict.fromkeys(
+        clause for word in words for clause in _fuzzy_word_clauses(word)
+    ))[:MAX_QUERY_CLAUSES])
+    if len(words) == 1:
+        return [any_word]
+    all_words = " AND ".join(f"({' OR '.join(_fuzzy_word_clauses(word)[:per_word])})" for word in words)
+    return [all_words, any_word]
+
+
+def _sqlite_candidates(db: Session, q: str, limit: int, status):
+    """
+    Primero busca las palabras como subcadenas (consulta selectiva y rápida);
+    solo si no alcanza para 'limit' resultados recurre a las consultas
+    difusas, que toleran errores pero tocan muchas más filas.
+    """
+    columns = ", ".join(f"b.{field}" for field in dict.fromkeys(RESULT_FIELDS + SEARCH_FIELDS))
+    status_filter = "AND b.status = :status" if status is not None else ""
+    params = {"limit": limit, "status": status.name if status is not None else None}
+
+    if not _words(q):
+        # Consultas de menos de 3 caracteres no forman trigramas: prefijo del nombre
+        sql = (
+            f"SELECT {columns} FROM buyers b WHERE b.name LIKE :prefix ESCAPE '\\' {status_filter} "
+            "ORDER BY b.name LIMIT :limit"
+        )
+        return db.execute(text(sql), {**params, "prefix": _escape_like(q) + "%"}).mappings().all()
+
+    # El índice ordena por bm25 (con los pesos de cada campo) antes de cortar:
+    # se reordenan los mejores candidatos, no los primeros por rowid
+    weights = ", ".join(str(FIELD_WEIGHTS[field] * 10) for field in SEARCH_FIELDS)
+    sql = text(
+        f"SELECT {columns} FROM buyers_fts JOIN buyers b ON b.id = buyers_fts.rowid "
+        f"WHERE buyers_fts MATCH :match {status_filter} "
+        f"ORDER BY bm25(buyers_fts, {weights}) LIMIT :limit"
+    )
+    # Coincidencias exactas: todas contienen las palabras
+    rows = list(db.execute(sql, {**params, "match": _fts_exact_query(q)}).mappings().all())
+    seen = {row["id"] for row in rows}
+    # Difusas, de la consulta más a la menos estricta: cláusulas selectivas
+    # (subcadenas o pares de trigramas) acotan cuántas filas puntúa bm25
+    for match in _fts_fuzzy_queries(q):
+        if len(rows) >= limit:
+            break
+        fuzzy = db.execute(sql, {**params, "match": match, "limit": FUZZY_CANDIDATES}).mappings().all()
+        rows.extend(row for row in fuzzy if row["id"] not in seen)
+        seen.update(row["id"] for row in fuzzy)
+    return rows
+
+
+def _postgres_candidates(db: Session, q: str, limit: int, status):
+    columns = ", ".join(dict.fromkeys(RESULT_FIELDS + SEARCH_FIELDS))
+    status_filter = "AND status = :status" if status is not None else ""
+    # Umbral del operador <% (usa el índice GIN) solo para esta transacción
+    db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"), {"threshold": str(MIN_SCORE)})
+    return db.execute(text(
+        f"SELECT {columns} FROM buyers WHERE :q <% ({_PG_SEARCH_EXPR}) {status_filter} "
+        f"ORDER BY word_similarity(:q, {_PG_SEARCH_EXPR}) DESC, id LIMIT :limit"
+    ), {"q": q, "limit": limit, "status": status.name if status is not None else None}).mappings().all()
+
+
+def _like_candidates(db: Session, q: str, limit: int, status):
+    columns = ", ".join(dict.fromkeys(RESULT_FIELDS + SEARCH_FIELDS))
+    status_filter = "AND status = :status" if status is not None else ""
+    conditions = " OR ".join(f"lower({field}) LIKE :pattern ESCAPE '\\'" for field in SEARCH_FIELDS)
+    return db.execute(
+        text(f"SELECT {columns} FROM buyers WHERE ({conditions}) {status_filter} LIMIT :limit"),
+        {"pattern": f"%{_escape_like(q.lower())}%", "limit": limit, "status": status.name if status is not None else None},
+    ).mappings().all()
+
+
+def search_buyers(db: Session, q: str, limit: int = 20, status=None) -> list:
+    """
+    Devuelve hasta 'limit' compradores ordenados por similitud con 'q'
+    (dicts con RESULT_FIELDS y 'score' entre 0 y 1).
+    """
+    q = q.strip()
+    if not q:
+        return []
+    dialect = db.get_bind().dialect.name
+    candidate_limit = limit * CANDIDATE_FACTOR
+    try:
+        if dialect == "sqlite":
+            rows = _sqlite_candidates(db, q, candidate_limit, status)
+        elif dialect == "postgresql":
+            rows = _postgres_candidates(db, q, candidate_limit, status)
+        else:
+            rows = _like_candidates(db, q, candidate_limit, status)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Buyer search index unavailable, falling back to LIKE: {str(e)}")
+        rows = _like_candidates(db, q, candidate_limit, status)
+
+    query_trigrams = trigrams(q)
+    results = []
+    for row in rows:
+        score = score_row(query_trigrams, row) if query_trigrams else 1.0
+        if score >= MIN_SCORE or len(q) < 3:
+            result = {field: row[field] for field in RESULT_FIELDS}
+            # SQL textual devuelve el nombre del enum tal como se almacena
+            if result["status"] in BuyerStatus.__members__:
+                result["status"] = BuyerStatus[result["status"]].value
+            result["score"] = round(score, 4)
+            results.append(result)
+    results.sort(key=lambda result: (-result["score"], result["id"]))
+    return results[:limit]
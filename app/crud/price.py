@@ -1,22 +1,394 @@
+import csv
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.models.price import Price, CommodityType
+from sqlalchemy import desc, select, insert, delete, case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models.price import Price, PriceRollup, CommodityType
+from app.utils.tick_store import TickStore
+from app.config import get_settings
+
+settings = get_settings()
+
+# Intervalos de agregación OHLC soportados por /prices/history
+ROLLUP_BUCKETS = ("1m", "1h", "1d")
+
+# Vista inmutable de la última cotización; expone los mismos atributos que Price
+PriceSnapshot = namedtuple("PriceSnapshot", ["commodity", "price", "unit", "source", "fetched_at"])
+
+# Caché write-through de la última cotización por commodity
+_latest_cache: dict = {}
+_cache_lock = threading.Lock()
+_cache_loaded_at = None
+
+# Versión del snapshot de precios: sube con cada escritura o recarga con cambios.
+# Permite a cachés derivadas (cotizaciones) invalidarse sin suscribirse a eventos.
+_price_version = 0
+
+
+def _snapshot(db_price: Price) -> PriceSnapshot:
+    return PriceSnapshot(
+        commodity=db_price.commodity,
+        price=db_price.price,
+        unit=db_price.unit,
+        source=db_price.source,
+        fetched_at=db_price.fetched_at,
+    )
+
+
+def _cache_put(snapshot: PriceSnapshot):
+    """Actualiza la caché solo si la cotización es más reciente que la almacenada."""
+    global _price_version
+    with _cache_lock:
+        current = _latest_cache.get(snapshot.commodity)
+        if current is None or current.fetched_at is None or (
+            snapshot.fetched_at is not None and snapshot.fetched_at >= current.fetched_at
+        ):
+            _latest_cache[snapshot.commodity] = snapshot
+            _price_version += 1
+
+
+def _latest_id_subquery(commodity: CommodityType):
+    return (
+        select(Price.id)
+        .where(Price.commodity == commodity)
+        .order_by(desc(Price.fetched_at))
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def _load_latest_from_db(db: Session) -> dict:
+    """
+    Obtiene la última cotización de todos los commodities en una sola consulta.
+    Cada subconsulta escalar es un seek sobre ix_prices_commodity_fetched_at,
+    así el costo es O(#commodities) sin importar el tamaño de la tabla
+    (funciona igual en SQLite y Postgres).
+    """
+    ids = [_latest_id_subquery(commodity) for commodity in CommodityType]
+    rows = db.execute(select(Price).where(Price.id.in_(ids))).scalars().all()
+    return {row.commodity: _snapshot(row) for row in rows}
+
+
+def _ensure_cache(db: Session):
+    """
+    Carga la caché desde BD la primera vez y cuando expira el TTL.
+    El TTL cubre escrituras hechas por otros procesos (p.ej. el worker de Celery).
+    """
+    global _cache_loaded_at, _price_version
+    loaded_at = _cache_loaded_at
+    if loaded_at is not None and time.monotonic() - loaded_at < settings.price_cache_ttl_seconds:
+        return
+    latest = _load_latest_from_db(db)
+    with _cache_lock:
+        if latest != _latest_cache:
+            _price_version += 1
+        _latest_cache.clear()
+        _latest_cache.update(latest)
+        _cache_loaded_at = time.monotonic()
+
+
+def _bucket_start(ts: datetime, bucket: str) -> datetime:
+    if bucket == "1m":
+        return ts.replace(second=0, microsecond=0)
+    if bucket == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_upsert(db: Session):
+    """
+    INSERT ... ON CONFLICT (commodity, bucket, bucket_start) que fusiona el
+    agregado nuevo con el existente en la misma sentencia: dos escritores
+    (API y Celery, o un backfill junto a un refresh) sobre el mismo intervalo
+    no chocan con la restricción única.
+    """
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(PriceRollup)
+    new, table = stmt.excluded, PriceRollup.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=[table.commodity, table.bucket, table.bucket_start],
+        set_={
+            "open": case((new.open_at < table.open_at, new.open), else_=table.open),
+            "open_at": case((new.open_at < table.open_at, new.open_at), else_=table.open_at),
+            "close": case((new.close_at >= table.close_at, new.close), else_=table.close),
+            "close_at": case((new.close_at >= table.close_at, new.close_at), else_=table.close_at),
+            "high": case((table.high.is_(None) | (new.high > table.high), new.high), else_=table.high),
+            "low": case((table.low.is_(None) | (new.low < table.low), new.low), else_=table.low),
+            "price_sum": func.coalesce(table.price_sum, 0) + new.price_sum,
+            "tick_count": func.coalesce(table.tick_count, 0) + new.tick_count,
+        },
+    )
+
+
+def _apply_rollups(db: Session, ticks):
+    """
+    Incorpora cotizaciones (commodity, price, fetched_at) a los agregados OHLC.
+    Primero agrega en memoria por intervalo y luego fusiona con las filas
+    existentes con un upsert por tamaño de intervalo. Los ticks sin precio no
+    se agregan. No hace commit: la escritura queda en la transacción del llamador.
+    """
+    ticks = [tick for tick in ticks if tick[1] is not None]
+    for bucket in ROLLUP_BUCKETS:
+        pending = {}
+        for commodity, price, ts in ticks:
+            key = (commodity, _bucket_start(ts, bucket))
+            agg = pending.get(key)
+            if agg is None:
+                pending[key] = [price, price, price, price, price, 1, ts, ts]
+                continue
+            if ts < agg[6]:
+                agg[0], agg[6] = price, ts
+            if ts >= agg[7]:
+                agg[3], agg[7] = price, ts
+            agg[1] = max(agg[1], price)
+            agg[2] = min(agg[2], price)
+            agg[4] += price
+            agg[5] += 1
+        if not pending:
+            continue
+
+        db.execute(_rollup_upsert(db), [
+            {
+                "commodity": commodity, "bucket": bucket, "bucket_start": start,
+                "open": open_, "high": high, "low": low, "close": close,
+                "price_sum": total, "tick_count": count, "open_at": open_at, "close_at": close_at,
+            }
+            for (commodity, start), (open_, high, low, close, total, count, open_at, close_at) in pending.items()
+        ])
+
+
+def _day_start(value) -> datetime:
+    # date() devuelve texto en SQLite y un date en Postgres
+    return datetime.fromisoformat(str(value)[:10])
+
+
+def backfill_price_rollups(db: Session, before: datetime = None) -> int:
+    """
+    Reconstruye los agregados de los días cuyo histórico crudo no está
+    completamente agregado (ticks anteriores a price_rollups o insertados por
+    fuera de create_price/create_prices_bulk). Por commodity y día compara los
+    ticks crudos con el tick_count del agregado 1d; si faltan, borra los
+    agregados de ese día y los recalcula desde los ticks, con commit por día.
+    Idempotente: los días cubiertos, o cuyo crudo ya se compactó (menos ticks
+    que el agregado), no se tocan. Con 'before' se limita a los días que
+    empiezan antes de esa fecha. Devuelve el número de días reconstruidos.
+
+    Sin 'before' recorre todo el histórico: se ejecuta una vez (setup_db.py)
+    y no al iniciar cada proceso. La compactación lo llama con 'before' y,
+    como el crudo anterior ya se borró, solo lee los días que va a borrar.
+    """
+    day = func.date(Price.fetched_at)
+    rolled_query = select(PriceRollup.commodity, PriceRollup.bucket_start, PriceRollup.tick_count).where(
+        PriceRollup.bucket == "1d"
+    )
+    until = None
+    if before is not None:
+        # Días completos: el día que contiene 'before' también se revisa
+        until = _bucket_start(before, "1d") + timedelta(days=1)
+        rolled_query = rolled_query.where(PriceRollup.bucket_start < until)
+    rolled = {(commodity, start): count or 0 for commodity, start, count in db.execute(rolled_query)}
+
+    stale = []
+    for commodity in CommodityType:
+        # Una consulta por commodity: rango sobre ix_prices_commodity_fetched_at
+        raw_query = (
+            select(day, func.count())
+            .where(Price.commodity == commodity, Price.price.is_not(None))
+            .group_by(day)
+        )
+        if until is not None:
+            raw_query = raw_query.where(Price.fetched_at < until)
+        stale.extend(
+            (commodity, _day_start(value))
+            for value, count in db.execute(raw_query)
+            if count > rolled.get((commodity, _day_start(value)), 0)
+        )
+    stale.sort()
+    for commodity, start in stale:
+        end = start + timedelta(days=1)
+        db.execute(delete(PriceRollup).where(
+            PriceRollup.commodity == commodity,
+            PriceRollup.bucket_start >= start,
+            PriceRollup.bucket_start < end,
+        ))
+        ticks = db.execute(
+            select(Price.commodity, Price.price, Price.fetched_at).where(
+                Price.commodity == commodity,
+                Price.price.is_not(None),
+                Price.fetched_at >= start,
+                Price.fetched_at < end,
+            )
+        ).all()
+        _apply_rollups(db, ticks)
+        db.commit()
+    return len(stale)
+
 
 def create_price(db: Session, commodity: CommodityType, price: float, unit: str, source: str):
-    db_price = Price(commodity=commodity, price=price, unit=unit, source=source)
+    fetched_at = datetime.utcnow()
+    db_price = Price(commodity=commodity, price=price, unit=unit, source=source, fetched_at=fetched_at)
     db.add(db_price)
+    _apply_rollups(db, [(commodity, price, fetched_at)])
     db.commit()
     db.refresh(db_price)
+    _cache_put(_snapshot(db_price))
+    TickStore.append(commodity, fetched_at, price)
     return db_price
 
+def create_prices_bulk(db: Session, ticks: list) -> int:
+    """
+    Inserta un conjunto de cotizaciones en una sola transacción (un executemany
+    y un commit), actualizando agregados OHLC y caché.
+    Cada tick es un dict con commodity, price, unit, source y fetched_at opcional.
+    """
+    if not ticks:
+        return 0
+    now = datetime.utcnow()
+    rows = [
+        {
+            "commodity": tick["commodity"],
+            "price": tick["price"],
+            "unit": tick.get("unit"),
+            "source": tick.get("source"),
+            "fetched_at": tick.get("fetched_at") or now,
+        }
+        for tick in ticks
+    ]
+    db.execute(insert(Price), rows)
+    _apply_rollups(db, [(row["commodity"], row["price"], row["fetched_at"]) for row in rows])
+    db.commit()
+    for row in sorted(rows, key=lambda row: row["fetched_at"]):
+        _cache_put(PriceSnapshot(**row))
+        TickStore.append(row["commodity"], row["fetched_at"], row["price"])
+    return len(rows)
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    # Las fechas se guardan en UTC sin zona: una con offset (p.ej. ...Z) se convierte
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def parse_price_csv(header: list, lines: list, first_row: int = 1):
+    """
+    Convierte líneas CSV de backfill (commodity,price,unit,source,fetched_at) en ticks.
+    Devuelve (ticks, errores) sin abortar por filas inválidas.
+    """
+    ticks, errors = [], []
+    for offset, row in enumerate(csv.DictReader(lines, fieldnames=header)):
+        try:
+            ticks.append({
+                "commodity": CommodityType(row["commodity"].strip().lower()),
+                "price": float(row["price"]),
+                "unit": (row.get("unit") or "").strip() or None,
+                "source": (row.get("source") or "").strip() or "backfill",
+                "fetched_at": _naive_utc(datetime.fromisoformat(row["fetched_at"].strip())),
+            })
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            errors.append({"row": first_row + offset, "error": str(e)})
+    return ticks, errors
+
+
 def get_latest_price(db: Session, commodity: CommodityType):
-    return db.query(Price).filter(Price.commodity == commodity).order_by(desc(Price.fetched_at)).first()
+    _ensure_cache(db)
+    return _latest_cache.get(commodity)
+
+def load_latest_prices(db: Session) -> dict:
+    """
+    Lee de BD la última cotización de cada commodity, sin pasar por el TTL de
+    la caché, y la incorpora a ella. Ve las escrituras de otros procesos.
+    """
+    latest = _load_latest_from_db(db)
+    for commodity, snapshot in latest.items():
+        if _latest_cache.get(commodity) != snapshot:
+            _cache_put(snapshot)
+    return latest
+
+def get_price_version(db: Session) -> int:
+    """Versión monótona del snapshot de últimas cotizaciones (cambia con cada precio nuevo)."""
+    _ensure_cache(db)
+    return _price_version
 
 def get_latest_prices_all(db: Session):
-    commodities = [CommodityType.GOLD, CommodityType.SILVER, CommodityType.COPPER, CommodityType.USD_PEN]
+    _ensure_cache(db)
     prices = {}
-    for commodity in commodities:
-        price = get_latest_price(db, commodity)
+    for commodity in CommodityType:
+        price = _latest_cache.get(commodity)
         if price:
             prices[commodity.value] = {"price": price.price, "unit": price.unit, "fetched_at": price.fetched_at}
     return prices
+
+def get_price_history(db: Session, commodity: CommodityType, bucket: str, start: datetime, end: datetime):
+    """Lee los agregados OHLC de un commodity en [start, end) desde price_rollups."""
+    return db.execute(
+        select(PriceRollup)
+        .where(
+            PriceRollup.commodity == commodity,
+            PriceRollup.bucket == bucket,
+            PriceRollup.bucket_start >= _bucket_start(start, bucket),
+            PriceRollup.bucket_start < end,
+        )
+        .order_by(PriceRollup.bucket_start)
+    ).scalars().all()
+
+
+def _delete_in_batches(db: Session, model, condition, batch_size: int) -> int:
+    """Borra filas por lotes acotados, con commit por lote, para no retener locks largos."""
+    deleted = 0
+    while True:
+        ids = select(model.id).where(condition).limit(batch_size)
+        result = db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+def compact_prices(db: Session, raw_before: datetime, minute_before: datetime, hour_before: datetime, batch_size: int = 5000) -> dict:
+    """
+    Aplica la retención: los ticks crudos y agregados finos más antiguos que su
+    ventana se eliminan. Antes de borrar crudos se agregan los días que aún no
+    estén en price_rollups (histórico previo a los agregados o cargado por
+    fuera de create_price*), así su información queda en los agregados 1h/1d.
+    La última cotización de cada commodity nunca se borra.
+    """
+    backfill_price_rollups(db, before=raw_before)
+    latest_ids = db.execute(
+        select(Price.id).where(Price.id.in_([_latest_id_subquery(commodity) for commodity in CommodityType]))
+    ).scalars().all()
+    raw_condition = Price.fetched_at < raw_before
+    if latest_ids:
+        raw_condition = raw_condition & Price.id.not_in(latest_ids)
+
+    return {
+        "raw": _delete_in_batches(db, Price, raw_condition, batch_size),
+        "1m": _delete_in_batches(
+            db, PriceRollup, (PriceRollup.bucket == "1m") & (PriceRollup.bucket_start < minute_before), batch_size
+        ),
+        "1h": _delete_in_batches(
+            db, PriceRollup, (PriceRollup.bucket == "1h") & (PriceRollup.bucket_start < hour_before), batch_size
+        ),
+    }
+
+
+def iter_price_rows(db: Session, commodity: CommodityType = None, start: datetime = None, end: datetime = None, batch_size: int = 5000):
+    """
+    Recorre el histórico crudo por lotes con yield_per (cursor del lado del
+    servidor en Postgres) sin materializar el resultado completo.
+    Produce listas de tuplas (commodity, price, unit, source, fetched_at).
+    """
+    query = select(Price.commodity, Price.price, Price.unit, Price.source, Price.fetched_at)
+    if commodity is not None:
+        query = query.where(Price.commodity == commodity)
+    if start is not None:
+        query = query.where(Price.fetched_at >= start)
+    if end is not None:
+        query = query.where(Price.fetched_at < end)
+    query = query.order_by(Price.fetched_at, Price.id).execution_options(yield_per=batch_size)
+    for partition in db.execute(query).partitions():
+        yield partition
@@ -46,4 +46,17 @@ def get_db():
 def init_db():
     """Inicializa la base de datos creando todas las tablas."""
     Base.metadata.create_all(bind=engine)
+    # create_all no toca tablas existentes: crear los índices nuevos que falten
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # Fechas de compradores escritas por CURRENT_TIMESTAMP (SQLite) al formato del ORM
+    from app.crud.buyer import normalize_buyer_timestamps
+    normalize_buyer_timestamps(engine)
+    # Índice de búsqueda de compradores (FTS5 / pg_trgm), fuera del ORM
+    from app.crud.buyer_search import ensure_search_index
+    ensure_search_index(engine)
+    # Índice espacial de compradores (R*Tree / GiST)
+    from app.crud.buyer_geo import ensure_geo_index
+    ensure_geo_index(engine)
     print(f"✅ Base de datos inicializada en: {settings.database_url}")
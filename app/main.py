@@ -2,7 +2,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings
 from app.database import Base, engine, init_db
-from app.routers import buyers, prices, budgets, chat, sunat, tasks
+from app.routers import buyers, prices, budgets, chat, sunat, tasks, alerts
+from app.services.price_fetcher import PriceFetcher
+from app.services.price_stream import PriceBroadcaster
+from app.services.sunat_verifier import SUNATVerifier
 
 settings = get_settings()
 
@@ -32,6 +35,18 @@ app.include_router(budgets.router)
 app.include_router(chat.router)
 app.include_router(sunat.router)
 app.include_router(tasks.router)  # Nuevo router de tareas
+app.include_router(alerts.router)
+
+@app.on_event("startup")
+async def start_price_watcher():
+    # Difunde por /prices/stream los precios guardados por otros procesos (Celery)
+    PriceBroadcaster.start_watcher()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await PriceBroadcaster.stop_watcher()
+    await PriceFetcher.close_async_client()
+    await SUNATVerifier.close_async_client()
 
 @app.get("/")
 def root():
@@ -43,6 +58,7 @@ def root():
             "docs": "/docs",
             "buyers": "/buyers",
             "prices": "/prices",
+            "alerts": "/alerts",
             "budgets": "/budgets",
             "chat": "/chat",
             "sunat": "/sunat",
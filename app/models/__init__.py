@@ -1,5 +1,6 @@
 from .buyer import Buyer, BuyerStatus
-from .price import Price, CommodityType
+from .price import Price, PriceRollup, CommodityType
 from .budget import Budget
+from .alert import PriceAlert, AlertKind
 
-__all__ = ["Buyer", "BuyerStatus", "Price", "CommodityType", "Budget"]
+__all__ = ["Buyer", "BuyerStatus", "Price", "PriceRollup", "CommodityType", "Budget", "PriceAlert", "AlertKind"]
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, Boolean, Index, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.price import CommodityType
+import enum
+
+class AlertKind(str, enum.Enum):
+    ABOVE = "above"  # precio >= umbral
+    BELOW = "below"  # precio <= umbral
+    PCT_UP = "pct_up"  # subida >= umbral % en window_minutes
+    PCT_DOWN = "pct_down"  # caída >= umbral % en window_minutes
+
+class PriceAlert(Base):
+    __tablename__ = "price_alerts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255))
+    commodity = Column(Enum(CommodityType), nullable=False)
+    kind = Column(Enum(AlertKind), nullable=False)
+    threshold = Column(Float, nullable=False)
+    window_minutes = Column(Integer)  # solo para pct_up / pct_down
+    active = Column(Boolean, default=True)
+    last_triggered_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # El motor carga solo reglas activas agrupadas por commodity
+        Index("ix_price_alerts_active_commodity", "active", "commodity"),
+    )
+
+
+class PriceAlertEvent(Base):
+    """Disparo de una regla. Compartido entre procesos: la API lo lee aunque lo registre el worker."""
+    __tablename__ = "price_alert_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    alert_id = Column(Integer, ForeignKey("price_alerts.id"), nullable=False)
+    name = Column(String(255))
+    commodity = Column(Enum(CommodityType), nullable=False)
+    kind = Column(Enum(AlertKind), nullable=False)
+    threshold = Column(Float, nullable=False)
+    window_minutes = Column(Integer)
+    observed = Column(Float)  # precio, o variación % en reglas porcentuales
+    price = Column(Float)
+    triggered_at = Column(DateTime, nullable=False)  # fecha del tick que la disparó
+    created_at = Column(DateTime, server_default=func.now())
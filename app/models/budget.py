@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
+# Columnas del listado /budgets: los índices las incluyen (INCLUDE en Postgres)
+# para que la paginación se resuelva solo con el índice, sin leer details_json
+BUDGET_SUMMARY_COLUMNS = ["quantity_kg", "law_percentage", "total_amount_pen", "net_amount_pen"]
+
 class Budget(Base):
     __tablename__ = "budgets"
     
@@ -20,3 +24,10 @@ class Budget(Base):
     net_amount_pen = Column(Float)
     details_json = Column(Text)  # JSON con detalles de cálculo
     created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Keyset (created_at, id) sobre todo el historial y por comprador / mineral
+        Index("ix_budgets_created_at_id", "created_at", "id", postgresql_include=BUDGET_SUMMARY_COLUMNS),
+        Index("ix_budgets_buyer_created_at_id", "buyer_id", "created_at", "id", postgresql_include=["mineral_type"] + BUDGET_SUMMARY_COLUMNS),
+        Index("ix_budgets_mineral_created_at_id", "mineral_type", "created_at", "id", postgresql_include=["buyer_id"] + BUDGET_SUMMARY_COLUMNS),
+    )
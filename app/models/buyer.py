@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Boolean, Float, Index
 from sqlalchemy.sql import func
+from datetime import datetime
 from app.database import Base
 import enum
 
@@ -16,6 +17,9 @@ class Buyer(Base):
     ruc = Column(String(11), unique=True, index=True)
     name = Column(String(255), index=True)
     address = Column(Text)
+    # Ubicación opcional (WGS84, grados); índice espacial en crud.buyer_geo
+    latitude = Column(Float)
+    longitude = Column(Float)
     phone = Column(String(20))
     email = Column(String(255))
     website = Column(String(255))
@@ -25,5 +29,14 @@ class Buyer(Base):
     sunat_verification_url = Column(String(255))
     verification_date = Column(DateTime)
     risk_notes = Column(Text)
-    created_at = Column(DateTime, server_default=func.now())
-    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Fechas desde Python (UTC): en SQLite CURRENT_TIMESTAMP no lleva microsegundos
+    # y no compara bien contra los valores que enlaza SQLAlchemy (cursor de /changes)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=func.now(), onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Re-verificación programada: los más antiguos primero
+        Index("ix_buyers_verification_date", "verification_date"),
+        # Feed de cambios: keyset (updated_at, id)
+        Index("ix_buyers_updated_at_id", "updated_at", "id"),
+    )
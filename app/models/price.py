@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
@@ -13,9 +13,36 @@ class Price(Base):
     __tablename__ = "prices"
     
     id = Column(Integer, primary_key=True, index=True)
-    commodity = Column(Enum(CommodityType), index=True)
+    commodity = Column(Enum(CommodityType))
     price = Column(Float)
     unit = Column(String(50))  # USD/oz, USD/kg, PEN/USD
     source = Column(String(100))
     fetched_at = Column(DateTime, server_default=func.now(), index=True)
     created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Última cotización por commodity = un seek al final de cada rango del índice
+        Index("ix_prices_commodity_fetched_at", "commodity", "fetched_at"),
+    )
+
+
+class PriceRollup(Base):
+    """Agregados OHLC por intervalo (1m, 1h, 1d), mantenidos al insertar cada cotización."""
+    __tablename__ = "price_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    commodity = Column(Enum(CommodityType), nullable=False)
+    bucket = Column(String(3), nullable=False)  # 1m, 1h, 1d
+    bucket_start = Column(DateTime, nullable=False)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    price_sum = Column(Float)
+    tick_count = Column(Integer)
+    open_at = Column(DateTime)  # fecha de la cotización usada como open
+    close_at = Column(DateTime)  # fecha de la cotización usada como close
+
+    __table_args__ = (
+        UniqueConstraint("commodity", "bucket", "bucket_start", name="uq_price_rollups_commodity_bucket_start"),
+    )
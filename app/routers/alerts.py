@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.crud import alert as crud_alert
+from app.models.alert import AlertKind
+from app.schemas.alert import PriceAlertCreate, PriceAlertResponse
+from app.services.price_alerts import AlertEngine
+
+router = APIRouter(prefix="/alerts", tags=["alerts"])
+
+@router.post("/", response_model=PriceAlertResponse)
+def create_alert(alert: PriceAlertCreate, db: Session = Depends(get_db)):
+    """
+    Crea una regla de alerta de precio.
+
+    Ejemplos: {"commodity": "usd_pen", "kind": "above", "threshold": 3.80}
+              {"commodity": "oro", "kind": "pct_up", "threshold": 2, "window_minutes": 60}
+    """
+    if alert.kind in (AlertKind.PCT_UP, AlertKind.PCT_DOWN) and alert.threshold <= 0:
+        raise HTTPException(status_code=400, detail="El umbral porcentual debe ser positivo")
+    db_alert = crud_alert.create_alert(db, alert)
+    AlertEngine.invalidate()
+    return db_alert
+
+@router.get("/", response_model=list[PriceAlertResponse])
+def list_alerts(active_only: bool = False, db: Session = Depends(get_db)):
+    return crud_alert.get_alerts(db, active_only=active_only)
+
+@router.delete("/{alert_id}", response_model=PriceAlertResponse)
+def deactivate_alert(alert_id: int, db: Session = Depends(get_db)):
+    db_alert = crud_alert.deactivate_alert(db, alert_id)
+    if not db_alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    AlertEngine.invalidate()
+    return db_alert
+
+@router.get("/fired")
+def get_fired_alerts(limit: int = Query(200, ge=1, le=1000), db: Session = Depends(get_db)):
+    """
+    Alertas disparadas recientemente, por la API o por el worker (también se
+    emiten como evento 'alert' en /prices/stream).
+    """
+    return {"status": "success", "data": crud_alert.get_alert_events(db, limit=limit)}
@@ -1,13 +1,43 @@
-from fastapi import APIRouter, Depends
+import io
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+import numpy as np
 from app.database import get_db
-from app.crud.price import get_latest_price
+from app.crud.price import get_latest_price, get_price_version
+from app.crud import budget as crud_budget
+from app.crud.buyer import get_existing_buyer_ids
 from app.models.price import CommodityType
+from app.services.budget_calculator import (
+    quote, quote_columns, sweep, SWEEP_AXES, SWEEP_MODES, SWEEP_PARAMS, SWEEP_MAX_CELLS,
+)
+from app.services.quote_cache import QuoteCache
+from app.services.budget_simulation import simulate_budget, SIMULATION_MODES, MIN_RETURNS, InsufficientHistoryError
+from app.utils.pagination import encode_cursor, decode_datetime_cursor
 import json
 
 router = APIRouter(prefix="/budgets", tags=["budgets"])
 
+# Campos de "details" en la respuesta de cada cotización
+QUOTE_DETAIL_FIELDS = (
+    "usable_kg", "base_price_usd", "base_price_pen", "discounted_price",
+    "net_before_tax", "taxes", "final_amount",
+)
+
+# Límites de /budgets/simulate
+SIMULATION_MAX_PATHS = 1_000_000
+SIMULATION_MAX_HORIZON_DAYS = 3650
+SIMULATION_MAX_LOOKBACK_DAYS = 3650
+
+# Mineral -> commodity con cotización
+MINERAL_COMMODITIES = {
+    "oro": CommodityType.GOLD,
+    "plata": CommodityType.SILVER,
+    "cobre": CommodityType.COPPER
+}
+
 class BudgetRequest(BaseModel):
     buyer_id: int
     mineral_type: str
@@ -18,18 +48,116 @@ class BudgetRequest(BaseModel):
     discounts_percentage: float = 0.0
     taxes_percentage: float = 18.0  # IGV
 
+def _budget_row(request: BudgetRequest, details: dict, metal_price: float, fx_rate: float) -> dict:
+    """Fila de budgets para una cotización de /generate o /batch."""
+    return {
+        "buyer_id": request.buyer_id,
+        "mineral_type": request.mineral_type.lower(),
+        "quantity_kg": request.quantity_kg,
+        "law_percentage": request.law_percentage,
+        "recovery_percentage": request.recovery_percentage,
+        "base_price_usd": details["base_price_usd"],
+        "fx_rate": fx_rate,
+        "freight_cost_pen": request.freight_cost_pen,
+        "discounts_percentage": request.discounts_percentage,
+        "taxes_percentage": request.taxes_percentage,
+        "total_amount_pen": details["final_amount"],
+        "net_amount_pen": details["net_before_tax"],
+        "details_json": {"type": "generate", "metal_price_usd_oz": metal_price, **details},
+    }
+
+class SweepRange(BaseModel):
+    values: Optional[List[float]] = Field(None, min_length=1, max_length=SWEEP_MAX_CELLS)
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: int = Field(11, ge=1, le=SWEEP_MAX_CELLS)
+
+    def size(self) -> int:
+        """Puntos del eje, sin construirlo."""
+        return len(self.values) if self.values is not None else self.steps
+
+    def to_array(self) -> np.ndarray:
+        if self.values is not None:
+            return np.asarray(self.values, dtype=np.float64)
+        if self.start is None or self.stop is None:
+            raise ValueError("Indique 'values' o 'start' y 'stop'")
+        return np.linspace(self.start, self.stop, self.steps)
+
+class SweepRequest(BaseModel):
+    mode: str = "generate"  # generate (/budgets/generate), buy (BudgetBuyAgent), sell (BudgetSellAgent)
+    mineral_type: str = "oro"
+    params: Dict[str, float] = {}  # parámetros fijos según el modo (SWEEP_PARAMS) y ejes sin rango
+    ranges: Dict[str, SweepRange] = {}  # ejes: law_percentage, recovery_percentage, price_usd_oz, fx_rate
+    break_even_target: Optional[float] = None  # monto objetivo para la grilla de precio de equilibrio
+    include_grid: bool = True
+
+class SimulationRequest(BaseModel):
+    mode: str = "sell"  # buy (BudgetBuyAgent) o sell (BudgetSellAgent)
+    mineral_type: str = "oro"
+    params: Dict[str, float] = {}  # weight_kg, law_percentage, recovery_percentage, costos y %
+    price_usd_oz: Optional[float] = Field(None, gt=0)  # precio inicial; por defecto la última cotización
+    fx_rate: Optional[float] = Field(None, gt=0)
+    n_paths: int = 100_000
+    horizon_days: float = Field(30, gt=0, le=SIMULATION_MAX_HORIZON_DAYS)
+    lookback_days: int = Field(365, ge=MIN_RETURNS + 1, le=SIMULATION_MAX_LOOKBACK_DAYS)
+    seed: Optional[int] = None
+
+@router.get("/")
+def list_budgets(
+    buyer_id: Optional[int] = None,
+    mineral_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """
+    Historial de presupuestos, del más reciente al más antiguo, paginado por
+    keyset sobre (created_at, id). Para la página siguiente envíe 'next_cursor'.
+
+    Ejemplo: GET /budgets/?buyer_id=12&mineral_type=oro&limit=100
+    """
+    try:
+        after = decode_datetime_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows, has_more = crud_budget.get_budgets_page(
+        db, buyer_id=buyer_id, mineral_type=mineral_type.lower() if mineral_type else None,
+        after=after, limit=limit,
+    )
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    return {
+        "status": "success",
+        "count": len(rows),
+        "next_cursor": next_cursor,
+        "data": [dict(row) for row in rows],
+    }
+
+@router.get("/{budget_id}")
+def get_budget(budget_id: int, db: Session = Depends(get_db)):
+    db_budget = crud_budget.get_budget(db, budget_id)
+    if not db_budget:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    return {
+        "status": "success",
+        "data": {
+            **{column.name: getattr(db_budget, column.name) for column in db_budget.__table__.columns if column.name != "details_json"},
+            "details": json.loads(db_budget.details_json) if db_budget.details_json else None,
+        },
+    }
+
 @router.post("/generate")
 def generate_budget(request: BudgetRequest, db: Session = Depends(get_db)):
     # Mapear mineral a commodity
-    commodity_map = {
-        "oro": CommodityType.GOLD,
-        "plata": CommodityType.SILVER,
-        "cobre": CommodityType.COPPER
-    }
-    
-    commodity = commodity_map.get(request.mineral_type.lower())
+    commodity = MINERAL_COMMODITIES.get(request.mineral_type.lower())
     if not commodity:
         return {"error": "Mineral type not supported"}
+
+    # Cotización idéntica con los mismos precios: se devuelve la ya guardada
+    cache_key = QuoteCache.make_key(get_price_version(db), request.model_dump())
+    cached = QuoteCache.get(cache_key)
+    if cached is not None:
+        return cached
     
     # Obtener precios actuales
     metal_price = get_latest_price(db, commodity)
@@ -37,38 +165,251 @@ def generate_budget(request: BudgetRequest, db: Session = Depends(get_db)):
     
     if not metal_price or not fx_rate:
         return {"error": "Precios no disponibles"}
+
+    if not get_existing_buyer_ids(db, [request.buyer_id]):
+        return {"error": "Comprador no encontrado"}
     
     # Cálculos
-    usable_kg = request.quantity_kg * (request.law_percentage / 100) * (request.recovery_percentage / 100)
-    base_price_usd = metal_price.price * usable_kg
-    base_price_pen = base_price_usd * fx_rate.price
-    
-    discounted_price = base_price_pen * (1 - request.discounts_percentage / 100)
-    freight_adjusted = discounted_price + request.freight_cost_pen
-    net_before_tax = freight_adjusted
-    taxes = net_before_tax * (request.taxes_percentage / 100)
-    final_amount = net_before_tax + taxes
-    
-    details = {
-        "usable_kg": usable_kg,
-        "base_price_usd": base_price_usd,
-        "base_price_pen": base_price_pen,
-        "discounted_price": discounted_price,
-        "freight_cost_pen": request.freight_cost_pen,
-        "net_before_tax": net_before_tax,
-        "taxes": taxes,
-        "final_amount": final_amount
-    }
+    quoted = quote(
+        request.quantity_kg, request.law_percentage, request.recovery_percentage,
+        metal_price.price, fx_rate.price,
+        request.discounts_percentage, request.freight_cost_pen, request.taxes_percentage,
+    )
+    details = {name: quoted[name] for name in QUOTE_DETAIL_FIELDS}
+    details["freight_cost_pen"] = request.freight_cost_pen
+
+    db_budget = crud_budget.create_budget(db, **_budget_row(request, details, metal_price.price, fx_rate.price))
     
-    return {
+    response = {
         "status": "success",
+        "budget_id": db_budget.id,
         "buyer_id": request.buyer_id,
         "mineral_type": request.mineral_type,
         "quantity_kg": request.quantity_kg,
         "law_percentage": request.law_percentage,
         "recovery_percentage": request.recovery_percentage,
-        "total_amount_pen": final_amount,
+        "total_amount_pen": details["final_amount"],
         "details": details,
         "metal_price_usd_oz": metal_price.price,
         "fx_rate": fx_rate.price
     }
+    QuoteCache.put(cache_key, response)
+    return response
+
+
+@router.post("/batch")
+def generate_budget_batch(requests: list[BudgetRequest], columnar: bool = False, db: Session = Depends(get_db)):
+    """
+    Cotiza muchos lotes en una sola petición. Los precios se leen una vez por
+    commodity y todos los montos se calculan como operaciones por columna.
+    Los resultados se devuelven en el orden de la petición; con columnar=true
+    se devuelven como columnas (listas paralelas) en lugar de objetos por fila.
+    Las cotizaciones válidas se guardan con un solo INSERT masivo.
+    """
+    fx_rate = get_latest_price(db, CommodityType.USD_PEN)
+    if not fx_rate:
+        return {"error": "Precios no disponibles"}
+
+    commodities = [MINERAL_COMMODITIES.get(r.mineral_type.lower()) for r in requests]
+    metal_prices = {c: get_latest_price(db, c) for c in set(commodities) if c is not None}
+
+    buyer_ids = get_existing_buyer_ids(db, {r.buyer_id for r in requests})
+
+    errors = {}
+    prices = np.full(len(requests), np.nan)
+    for i, commodity in enumerate(commodities):
+        if commodity is None:
+            errors[i] = "Mineral type not supported"
+        elif requests[i].buyer_id not in buyer_ids:
+            errors[i] = "Comprador no encontrado"
+        elif not metal_prices[commodity]:
+            errors[i] = "Precios no disponibles"
+        else:
+            prices[i] = metal_prices[commodity].price
+
+    columns = quote_columns(
+        quantity_kg=[r.quantity_kg for r in requests],
+        law_percentage=[r.law_percentage for r in requests],
+        recovery_percentage=[r.recovery_percentage for r in requests],
+        metal_price=prices,
+        fx_rate=fx_rate.price,
+        discounts_percentage=[r.discounts_percentage for r in requests],
+        freight_cost_pen=[r.freight_cost_pen for r in requests],
+        taxes_percentage=[r.taxes_percentage for r in requests],
+    )
+    columns["metal_price_usd_oz"] = prices
+
+    valid = [i for i in range(len(requests)) if i not in errors]
+    rows = [
+        _budget_row(
+            requests[i],
+            {name: float(columns[name][i]) for name in QUOTE_DETAIL_FIELDS},
+            float(prices[i]),
+            fx_rate.price,
+        )
+        for i in valid
+    ]
+    budget_ids = [None] * len(requests)
+    for i, budget_id in zip(valid, crud_budget.create_budgets_bulk(db, rows)):
+        budget_ids[i] = budget_id
+
+    # NaN (filas con error) -> null; JSONResponse evita el jsonable_encoder por fila
+    columns = {name: np.where(np.isnan(values), None, values).tolist() for name, values in columns.items()}
+
+    if columnar:
+        return JSONResponse({
+            "status": "success",
+            "count": len(requests),
+            "fx_rate": fx_rate.price,
+            "errors": errors,
+            "budget_ids": budget_ids,
+            "columns": columns,
+        })
+
+    results = []
+    for i, r in enumerate(requests):
+        if i in errors:
+            results.append({"index": i, "error": errors[i]})
+            continue
+        details = {name: columns[name][i] for name in QUOTE_DETAIL_FIELDS}
+        details["freight_cost_pen"] = r.freight_cost_pen
+        results.append({
+            "index": i,
+            "budget_id": budget_ids[i],
+            "buyer_id": r.buyer_id,
+            "mineral_type": r.mineral_type,
+            "quantity_kg": r.quantity_kg,
+            "law_percentage": r.law_percentage,
+            "recovery_percentage": r.recovery_percentage,
+            "total_amount_pen": details["final_amount"],
+            "details": details,
+            "metal_price_usd_oz": columns["metal_price_usd_oz"][i],
+            "fx_rate": fx_rate.price
+        })
+    return JSONResponse({"status": "success", "count": len(requests), "results": results})
+
+
+@router.post("/sweep")
+def sweep_budget(request: SweepRequest, format_: str = Query("json", alias="format"), db: Session = Depends(get_db)):
+    """
+    Sensibilidad del monto neto sobre la grilla cartesiana de ley %, recuperación %,
+    precio y tipo de cambio. Los ejes sin rango usan 'params' o, para precio y
+    tipo de cambio, la última cotización. 'params' exige la cantidad del modo
+    (quantity_kg en generate, weight_kg en buy/sell) y rechaza claves
+    desconocidas. Con format=npz devuelve la grilla en
+    binario NumPy (recomendado para millones de celdas).
+    """
+    if request.mode not in SWEEP_MODES:
+        raise HTTPException(status_code=400, detail=f"Modo no válido: {request.mode}. Use {', '.join(SWEEP_MODES)}")
+    unknown = set(request.ranges) - set(SWEEP_AXES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Ejes no soportados: {', '.join(sorted(unknown))}")
+    # Un parámetro mal escrito no debe caer en silencio a su valor por defecto
+    required, optional = SWEEP_PARAMS[request.mode]
+    unknown = set(request.params) - set(SWEEP_AXES) - set(required) - set(optional)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Parámetros no válidos para {request.mode}: {', '.join(sorted(unknown))}. "
+                   f"Use {', '.join(SWEEP_AXES + required + optional)}",
+        )
+    missing = [name for name in required if name not in request.params]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Faltan parámetros: {', '.join(missing)}")
+
+    defaults = {"law_percentage": 100.0, "recovery_percentage": 95.0}
+    if "price_usd_oz" not in request.ranges and "price_usd_oz" not in request.params:
+        commodity = MINERAL_COMMODITIES.get(request.mineral_type.lower())
+        metal_price = get_latest_price(db, commodity) if commodity else None
+        if not metal_price:
+            raise HTTPException(status_code=400, detail="Precio no disponible: indique price_usd_oz")
+        defaults["price_usd_oz"] = metal_price.price
+    if "fx_rate" not in request.ranges and "fx_rate" not in request.params:
+        fx_rate = get_latest_price(db, CommodityType.USD_PEN)
+        if not fx_rate:
+            raise HTTPException(status_code=400, detail="Tipo de cambio no disponible: indique fx_rate")
+        defaults["fx_rate"] = fx_rate.price
+
+    # El tamaño se valida antes de construir los ejes (np.linspace reserva memoria)
+    cells = int(np.prod([request.ranges[name].size() if name in request.ranges else 1 for name in SWEEP_AXES]))
+    if cells > SWEEP_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"La grilla tiene {cells} celdas (máximo {SWEEP_MAX_CELLS})")
+
+    try:
+        axes = {
+            name: request.ranges[name].to_array() if name in request.ranges
+            else np.array([request.params.get(name, defaults.get(name))], dtype=np.float64)
+            for name in SWEEP_AXES
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    params = {name: value for name, value in request.params.items() if name not in SWEEP_AXES}
+    result = sweep(request.mode, axes, params, request.break_even_target)
+    grid = result["grid"]
+
+    if format_ == "npz":
+        buffer = io.BytesIO()
+        np.savez(buffer, grid=grid, **axes, **{k: v for k, v in result.items() if k != "grid"})
+        return Response(buffer.getvalue(), media_type="application/octet-stream",
+                        headers={"Content-Disposition": 'attachment; filename="budget_sweep.npz"'})
+
+    _, amount_name = SWEEP_MODES[request.mode]
+    body = {
+        "status": "success",
+        "mode": request.mode,
+        "amount": amount_name,
+        "axes": {name: values.tolist() for name, values in axes.items()},
+        "shape": list(grid.shape),
+        "summary": {
+            "min": float(grid.min()),
+            "max": float(grid.max()),
+            "mean": float(grid.mean()),
+        },
+    }
+    if request.include_grid:
+        body["grid"] = grid.tolist()
+    if "break_even_price_usd_oz" in result:
+        break_even = result["break_even_price_usd_oz"]
+        body["break_even_target"] = request.break_even_target
+        body["break_even_price_usd_oz"] = np.where(np.isnan(break_even), None, break_even).tolist()
+    return JSONResponse(body)
+
+
+@router.post("/simulate")
+def simulate_budget_risk(request: SimulationRequest, db: Session = Depends(get_db)):
+    """
+    Monte Carlo del presupuesto de compra/venta: distribución del monto
+    (P5/P50/P95, VaR 95%) con precios y USD/PEN correlacionados según el
+    histórico. Use 'seed' para resultados reproducibles.
+    """
+    if request.mode not in SIMULATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Modo no válido: {request.mode}. Use {', '.join(SIMULATION_MODES)}")
+    if not 1 <= request.n_paths <= SIMULATION_MAX_PATHS:
+        raise HTTPException(status_code=400, detail=f"n_paths debe estar entre 1 y {SIMULATION_MAX_PATHS}")
+    commodity = MINERAL_COMMODITIES.get(request.mineral_type.lower())
+    if not commodity:
+        raise HTTPException(status_code=400, detail="Mineral type not supported")
+
+    spot = {}
+    for c in CommodityType:
+        latest = get_latest_price(db, c)
+        if latest:
+            spot[c] = latest.price
+    if request.price_usd_oz is not None:
+        spot[commodity] = request.price_usd_oz
+    if request.fx_rate is not None:
+        spot[CommodityType.USD_PEN] = request.fx_rate
+
+    params = {k: v for k, v in request.params.items() if k not in ("price_usd_oz", "fx_rate")}
+    try:
+        result = simulate_budget(
+            db, request.mode, commodity, params, spot,
+            n_paths=request.n_paths, horizon_days=request.horizon_days,
+            lookback_days=request.lookback_days, seed=request.seed,
+        )
+    except InsufficientHistoryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TypeError as e:
+        raise HTTPException(status_code=400, detail=f"Parámetros no válidos: {e}")
+    return {"status": "success", "mode": request.mode, "mineral_type": request.mineral_type, **result}
@@ -1,13 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import json
+import anyio
+from datetime import timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.config import get_settings
+from app.database import get_db, SessionLocal
 from app.crud import buyer as crud_buyer
+from app.crud.buyer_search import search_buyers
+from app.crud.buyer_geo import find_nearby_buyers
+from app.utils.http_cache import etag_json_response
+from app.utils.pagination import encode_cursor, decode_cursor, decode_datetime_cursor
+from app.utils.streaming import iter_request_lines
 from app.schemas.buyer import BuyerCreate, BuyerResponse
 from app.services.sunat_verifier import SUNATVerifier
 from app.models.buyer import BuyerStatus
 
+settings = get_settings()
+
 router = APIRouter(prefix="/buyers", tags=["buyers"])
 
+# Errores por fila devueltos como máximo en /import
+IMPORT_MAX_ERRORS = 1000
+
+# Resultados de verificación acumulados antes de cada escritura en bloque
+VERIFY_FLUSH_SIZE = 200
+
+class VerifyBatchRequest(BaseModel):
+    ids: Optional[List[int]] = None  # sin ids: todos los que cumplan el filtro
+    status: Optional[BuyerStatus] = None
+    limit: Optional[int] = None
+    concurrency: Optional[int] = None  # por defecto y como máximo SUNAT_VERIFY_CONCURRENCY
+
 @router.post("/", response_model=BuyerResponse)
 def create_buyer(buyer: BuyerCreate, db: Session = Depends(get_db)):
     db_buyer = crud_buyer.get_buyer_by_ruc(db, ruc=buyer.ruc)
@@ -15,9 +43,250 @@ def create_buyer(buyer: BuyerCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Buyer with this RUC already exists")
     return crud_buyer.create_buyer(db=db, buyer=buyer)
 
-@router.get("/", response_model=list[BuyerResponse])
-def list_buyers(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return crud_buyer.get_buyers(db, skip=skip, limit=limit)
+def _import_chunk(db: Session, records: list, first_row: int, seen: set, update_existing: bool) -> dict:
+    valid, errors = crud_buyer.parse_buyer_records(records, first_row)
+    rows = []
+    for row_number, row in valid:
+        if row["ruc"] in seen:
+            errors.append({"row": row_number, "error": f"RUC duplicado en el archivo: {row['ruc']}"})
+            continue
+        seen.add(row["ruc"])
+        rows.append(row)
+    existing = crud_buyer.get_existing_rucs(db, (row["ruc"] for row in rows))
+    crud_buyer.upsert_buyers(db, rows, update_existing=update_existing)
+    return {
+        "inserted": len(rows) - len(existing),
+        "updated": len(existing) if update_existing else 0,
+        "skipped": 0 if update_existing else len(existing),
+        "errors": errors,
+    }
+
+@router.post("/import")
+async def import_buyers(
+    request: Request,
+    format_: Optional[str] = Query(None, alias="format"),
+    chunk_size: int = Query(1000, ge=1, le=50000),
+    update_existing: bool = True,
+    db: Session = Depends(get_db),
+):
+    """
+    Importación masiva desde CSV (con cabecera) o NDJSON enviado como cuerpo.
+    Se procesa por bloques: validación, un solo SELECT de RUCs existentes y un
+    INSERT ... ON CONFLICT por bloque. Sin 'format' se deduce del Content-Type.
+    Al actualizar, las columnas ausentes o vacías conservan el valor guardado.
+
+    Ejemplo: curl -X POST -H 'Content-Type: application/x-ndjson' --data-binary @buyers.ndjson /buyers/import
+    """
+    content_type = request.headers.get("content-type", "")
+    format_ = (format_ or ("ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv")).lower()
+    if format_ not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format_}. Use csv o ndjson")
+
+    header = None
+    pending = []
+    first_row = 1
+    seen = set()
+    totals = {"inserted": 0, "updated": 0, "skipped": 0}
+    errors = []
+    rejected = 0
+
+    async def flush():
+        nonlocal pending, first_row, rejected
+        records = list(csv.DictReader(pending, fieldnames=header)) if format_ == "csv" else pending
+        result = await run_in_threadpool(_import_chunk, db, records, first_row, seen, update_existing)
+        for key in totals:
+            totals[key] += result[key]
+        rejected += len(result["errors"])
+        errors.extend(result["errors"][:max(IMPORT_MAX_ERRORS - len(errors), 0)])
+        first_row += len(pending)
+        pending = []
+
+    async for line in iter_request_lines(request):
+        if format_ == "csv" and header is None:
+            header = [column.strip().lower() for column in next(csv.reader([line]))]
+            continue
+        pending.append(line)
+        if len(pending) >= chunk_size:
+            await flush()
+    if format_ == "csv" and header is None:
+        raise HTTPException(status_code=400, detail="CSV vacío")
+    if pending:
+        await flush()
+
+    return {
+        "status": "success",
+        **totals,
+        "rejected": rejected,
+        "errors": sorted(errors, key=lambda error: error["row"]),
+    }
+
+def _write_verifications(updates: list):
+    db = SessionLocal()
+    try:
+        crud_buyer.update_buyer_statuses_bulk(db, updates)
+    finally:
+        db.close()
+
+@router.post("/verify-batch")
+async def verify_buyers_batch(request: VerifyBatchRequest, db: Session = Depends(get_db)):
+    """
+    Verifica en SUNAT muchos compradores en paralelo (concurrencia acotada) y
+    escribe los estados por bloques. La respuesta es NDJSON: una línea por
+    comprador a medida que llegan los resultados y una línea final con totales.
+
+    Ejemplo: POST /buyers/verify-batch {"status": "pending", "limit": 5000}
+    """
+    max_concurrency = settings.sunat_verify_concurrency
+    if request.concurrency is not None and not 1 <= request.concurrency <= max_concurrency:
+        # Más consultas que conexiones en el pool solo harían esperar a los workers
+        raise HTTPException(status_code=400, detail=f"concurrency debe estar entre 1 y {max_concurrency}")
+    targets = await run_in_threadpool(
+        crud_buyer.get_buyers_to_verify, db, request.ids, request.status, request.limit
+    )
+
+    async def events():
+        pending = []
+        totals = {"total": len(targets), "verified": 0, "suspicious": 0, "failed": 0}
+        done = 0
+        try:
+            async for buyer_id, verification in SUNATVerifier.verify_many(
+                ((buyer_id, ruc) for buyer_id, ruc in targets), request.concurrency
+            ):
+                update = SUNATVerifier.status_update(buyer_id, verification)
+                done += 1
+                if update is None:
+                    # SUNAT no respondió: se informa pero el comprador queda como estaba
+                    totals["failed"] += 1
+                else:
+                    pending.append(update)
+                    totals["verified" if update["status"] == BuyerStatus.VERIFIED else "suspicious"] += 1
+                yield json.dumps({
+                    "id": buyer_id,
+                    "ruc": verification.get("ruc"),
+                    "status": update["status"].value if update is not None else None,
+                    "error": verification.get("error"),
+                    "done": done,
+                    "total": totals["total"],
+                }) + "\n"
+                if len(pending) >= VERIFY_FLUSH_SIZE:
+                    await run_in_threadpool(_write_verifications, pending)
+                    pending = []
+            if pending:
+                await run_in_threadpool(_write_verifications, pending)
+                pending = []
+            yield json.dumps({"event": "done", **totals}) + "\n"
+        finally:
+            # Cliente desconectado: guardar lo ya verificado, fuera del event loop.
+            # El shield evita que la cancelación de la respuesta corte la escritura
+            if pending:
+                with anyio.CancelScope(shield=True):
+                    await run_in_threadpool(_write_verifications, pending)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.get("/")
+def list_buyers(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Listado paginado por id: una lista de objetos con los campos de
+    BuyerResponse o, con 'fields', solo los pedidos (id siempre incluido;
+    campos admitidos: los de BUYER_LIST_FIELDS).
+    La cabecera X-Next-Cursor trae el cursor de la página siguiente (ausente
+    en la última). Responde 304 si If-None-Match coincide con el ETag.
+
+    Ejemplo: GET /buyers/?limit=100&fields=name,ruc,status&cursor=WzEwMF0
+    """
+    columns = crud_buyer.BUYER_LIST_FIELDS
+    if fields:
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in crud_buyer.BUYER_LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campos no válidos: {', '.join(unknown)}")
+        columns = ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+    after_id = None
+    if cursor:
+        try:
+            (after_id,) = decode_cursor(cursor)
+            after_id = int(after_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor no válido")
+
+    rows, has_more = crud_buyer.get_buyers_page(db, columns, after_id=after_id, skip=skip, limit=limit)
+    headers = {"X-Next-Cursor": encode_cursor(rows[-1]["id"])} if has_more else None
+    return etag_json_response(request, [dict(row) for row in rows], headers)
+
+@router.get("/search")
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[BuyerStatus] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Búsqueda tolerante a errores de tipeo en nombre, dirección, clasificación
+    y certificados, ordenada por similitud (score 0-1).
+
+    Ejemplo: GET /buyers/search?q=minera trujilo&status=verified
+    """
+    results = search_buyers(db, q, limit=limit, status=status)
+    return {"status": "success", "query": q, "count": len(results), "data": results}
+
+@router.get("/nearby")
+def nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(100, gt=0, description="Radio en km"),
+    limit: int = Query(20, ge=1, le=200),
+    status: Optional[BuyerStatus] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Compradores más cercanos a un punto (p.ej. la mina) dentro de 'radius' km,
+    ordenados por distancia. Solo considera compradores con latitud/longitud.
+
+    Ejemplo: GET /buyers/nearby?lat=-8.11&lon=-79.03&radius=150&status=verified
+    """
+    if radius > settings.buyer_nearby_max_radius_km:
+        raise HTTPException(status_code=400, detail=f"Radio máximo: {settings.buyer_nearby_max_radius_km} km")
+    results = find_nearby_buyers(db, lat, lon, radius, limit=limit, status=status)
+    return {"status": "success", "count": len(results), "data": results}
+
+@router.get("/changes")
+def buyer_changes(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """
+    Feed de cambios para sincronización incremental: compradores creados o
+    modificados (datos, estado, verificación) después del cursor 'since'.
+    Sin 'since' recorre todo desde el inicio. Guarde 'next_cursor' y úselo en
+    la próxima llamada; con has_more=true pida de inmediato la página siguiente.
+
+    Ejemplo: GET /buyers/changes?since=WyIyMDI0LTA1LTAxVDEwOjAwOjAwIiw0Ml0
+    """
+    try:
+        after = decode_datetime_cursor(since) if since else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows, has_more = crud_buyer.get_buyer_changes(db, after, limit, settings.buyer_changes_lag_seconds)
+    # Sin cambios el cursor no avanza: el cliente vuelve a preguntar con el mismo
+    next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"]) if rows else since
+    return {
+        "status": "success",
+        "count": len(rows),
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        "data": [dict(row) for row in rows],
+    }
 
 @router.get("/{buyer_id}", response_model=BuyerResponse)
 def get_buyer(buyer_id: int, db: Session = Depends(get_db)):
@@ -27,18 +296,34 @@ def get_buyer(buyer_id: int, db: Session = Depends(get_db)):
     return db_buyer
 
 @router.post("/{buyer_id}/verify")
-def verify_buyer(buyer_id: int, db: Session = Depends(get_db)):
+def verify_buyer(buyer_id: int, force: bool = False, db: Session = Depends(get_db)):
+    """
+    Verifica el RUC en SUNAT. Si la última verificación está dentro de
+    VERIFICATION_TTL_HOURS se devuelve el estado guardado sin consultar
+    (use force=true para consultar igualmente).
+    """
     db_buyer = db.query(crud_buyer.Buyer).filter(crud_buyer.Buyer.id == buyer_id).first()
     if not db_buyer:
         raise HTTPException(status_code=404, detail="Buyer not found")
+
+    if not force and crud_buyer.is_verification_fresh(db_buyer, timedelta(hours=settings.verification_ttl_hours)):
+        verification = {
+            "ruc": db_buyer.ruc,
+            "active": db_buyer.status == BuyerStatus.VERIFIED,
+            "verified": db_buyer.status == BuyerStatus.VERIFIED,
+            "source": "cache",
+            "verified_at": db_buyer.verification_date,
+        }
+        if db_buyer.status != BuyerStatus.VERIFIED:
+            verification["error"] = db_buyer.risk_notes
+        return {"ruc": db_buyer.ruc, "verification": verification}
     
     verification = SUNATVerifier.verify_ruc(db_buyer.ruc)
     
-    if verification.get("verified"):
-        crud_buyer.update_buyer_status(db, buyer_id, BuyerStatus.VERIFIED)
-    else:
-        crud_buyer.update_buyer_status(db, buyer_id, BuyerStatus.SUSPICIOUS, 
-                                       risk_notes=verification.get("error"))
+    update = SUNATVerifier.status_update(buyer_id, verification)
+    # Si SUNAT no respondió se devuelve el error sin tocar el estado guardado
+    if update is not None:
+        crud_buyer.update_buyer_status(db, buyer_id, update["status"], risk_notes=update["risk_notes"])
     
     return {"ruc": db_buyer.ruc, "verification": verification}
 
@@ -1,11 +1,44 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import csv
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.crud.price import get_latest_prices_all
+from app.database import get_db, SessionLocal
+from app.config import get_settings
+from app.crud.price import (
+    get_latest_prices_all,
+    get_price_history,
+    create_prices_bulk,
+    parse_price_csv,
+    ROLLUP_BUCKETS,
+)
+from app.models.price import CommodityType
 from app.services.price_fetcher import PriceFetcher
+from app.services.price_stream import PriceBroadcaster
+from app.services import indicators, price_export
+from app.utils.streaming import iter_request_lines
+from app.utils.tick_store import TickStore
+
+settings = get_settings()
 
 router = APIRouter(prefix="/prices", tags=["prices"])
 
+# Ventana por defecto de /indicators (días)
+INDICATORS_DEFAULT_LOOKBACK_DAYS = 90
+
+# Intervalo de comentarios keep-alive en /stream (segundos)
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Rango por defecto de /history según el intervalo pedido
+HISTORY_DEFAULT_SPAN = {
+    "1m": timedelta(days=1),
+    "1h": timedelta(days=30),
+    "1d": timedelta(days=365 * 5),
+}
+
 @router.get("/latest")
 def get_latest_prices(db: Session = Depends(get_db)):
     prices = get_latest_prices_all(db)
@@ -15,7 +48,237 @@ def get_latest_prices(db: Session = Depends(get_db)):
         "message": "Últimas cotizaciones disponibles"
     }
 
+def _parse_commodity(commodity: str) -> CommodityType:
+    try:
+        return CommodityType(commodity.lower())
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Commodity no soportado: {commodity}")
+
+def _latest_snapshot():
+    # Sesión propia y corta: el stream no debe retener una conexión del pool
+    db = SessionLocal()
+    try:
+        return get_latest_prices_all(db)
+    finally:
+        db.close()
+
+@router.get("/stream")
+async def stream_prices(request: Request):
+    """
+    Server-Sent Events con cada nuevo conjunto de cotizaciones.
+    Envía primero un evento 'snapshot' y luego un evento 'prices' por cada refresh.
+    """
+    snapshot = await run_in_threadpool(_latest_snapshot)
+    queue = PriceBroadcaster.subscribe()
+
+    async def events():
+        try:
+            yield PriceBroadcaster.format_event("snapshot", snapshot)
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            PriceBroadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/history/{commodity}")
+def get_history(
+    commodity: str,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    bucket: str = "1h",
+    db: Session = Depends(get_db),
+):
+    """
+    Serie OHLC agregada por intervalo (1m, 1h, 1d).
+
+    Ejemplo: GET /prices/history/oro?bucket=1d&from=2024-01-01T00:00:00
+    """
+    commodity_type = _parse_commodity(commodity)
+    if bucket not in ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Intervalo no válido: {bucket}. Use {', '.join(ROLLUP_BUCKETS)}")
+
+    end = to or datetime.utcnow()
+    start = from_ or end - HISTORY_DEFAULT_SPAN[bucket]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+
+    rows = get_price_history(db, commodity_type, bucket, start, end)
+    return {
+        "status": "success",
+        "commodity": commodity_type.value,
+        "bucket": bucket,
+        "from": start,
+        "to": end,
+        "data": [
+            {
+                "t": row.bucket_start,
+                "open": row.open,
+                "high": row.high,
+                "low": row.low,
+                "close": row.close,
+                "avg": row.price_sum / row.tick_count,
+                "count": row.tick_count,
+            }
+            for row in rows
+        ],
+    }
+
+@router.get("/ticks/{commodity}")
+def get_recent_ticks(commodity: str, n: int = Query(500, ge=1), include_series: bool = False):
+    """
+    Estadísticas intradía sobre los últimos n ticks en memoria (sin consultar BD).
+
+    Ejemplo: GET /prices/ticks/oro?n=100
+    """
+    commodity_type = _parse_commodity(commodity)
+    if not TickStore.enabled():
+        raise HTTPException(status_code=503, detail="Tick store desactivado (TICK_STORE_CAPACITY=0)")
+
+    ts, px = TickStore.last(commodity_type, n)
+    if not len(px):
+        return {"status": "success", "commodity": commodity_type.value, "count": 0}
+
+    stats = {
+        "status": "success",
+        "commodity": commodity_type.value,
+        "count": int(len(px)),
+        "from": datetime.utcfromtimestamp(ts[0]),
+        "to": datetime.utcfromtimestamp(ts[-1]),
+        "last": float(px[-1]),
+        "min": float(px.min()),
+        "max": float(px.max()),
+        "mean": float(px.mean()),
+        "std": float(px.std()),
+        "change_pct": float((px[-1] / px[0] - 1) * 100) if px[0] else None,
+    }
+    if include_series:
+        stats["series"] = {"t": ts.tolist(), "price": px.tolist()}
+    return stats
+
+@router.get("/indicators")
+def get_indicators(
+    commodity: Optional[str] = None,
+    lookback_days: Optional[int] = Query(None, ge=1),
+    short_window: int = Query(5, ge=2),
+    long_window: int = Query(20, ge=2),
+    vol_window: int = Query(20, ge=2),
+    include_series: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Indicadores técnicos (SMA/EMA, volatilidad, retornos, drawdown, serie en PEN)
+    calculados sobre el histórico crudo, por eso lookback_days no supera
+    PRICE_RAW_RETENTION_DAYS (lo anterior ya fue compactado); por defecto 90
+    días o la retención si es menor.
+
+    Ejemplo: GET /prices/indicators?commodity=oro&lookback_days=30
+    """
+    if lookback_days is None:
+        lookback_days = min(INDICATORS_DEFAULT_LOOKBACK_DAYS, settings.price_raw_retention_days)
+    if lookback_days > settings.price_raw_retention_days:
+        raise HTTPException(
+            status_code=400,
+            detail=f"lookback_days debe estar entre 1 y {settings.price_raw_retention_days} (retención del histórico crudo)",
+        )
+    commodities = [_parse_commodity(commodity)] if commodity else None
+    data = indicators.analyze(
+        db, commodities, lookback_days,
+        short_window=short_window, long_window=long_window,
+        vol_window=vol_window, include_series=include_series,
+    )
+    return {"status": "success", "lookback_days": lookback_days, "data": data}
+
+@router.get("/export")
+def export_prices(
+    format_: str = Query("csv", alias="format"),
+    commodity: Optional[str] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+):
+    """
+    Exporta el histórico crudo en streaming (memoria constante).
+
+    Ejemplo: GET /prices/export?format=parquet&commodity=oro&from=2024-01-01T00:00:00
+    """
+    commodity_type = _parse_commodity(commodity) if commodity else None
+    filename = f"prices_{commodity_type.value if commodity_type else 'all'}"
+    if format_ == "csv":
+        return StreamingResponse(
+            price_export.iter_csv(commodity_type, from_, to),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'},
+        )
+    if format_ == "parquet":
+        if not price_export.parquet_available():
+            raise HTTPException(status_code=501, detail="Exportación Parquet requiere pyarrow")
+        return StreamingResponse(
+            price_export.iter_parquet(commodity_type, from_, to),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.parquet"'},
+        )
+    raise HTTPException(status_code=400, detail=f"Formato no soportado: {format_}. Use csv o parquet")
+
 @router.post("/refresh")
-def refresh_prices(db: Session = Depends(get_db)):
-    PriceFetcher.store_prices(db)
-    return {"status": "success", "message": "Precios actualizados"}
+async def refresh_prices(force: bool = False):
+    """
+    Consulta las fuentes y almacena precios. Las llamadas concurrentes comparten
+    una sola consulta; dentro de PRICE_REFRESH_MIN_INTERVAL_SECONDS se devuelven
+    los precios en caché (use force=true para ignorar la ventana).
+    """
+    result = await PriceFetcher.refresh(force=force)
+    return {
+        "status": "success",
+        "message": "Precios actualizados" if result["refreshed"] else "Precios vigentes, no se consultaron fuentes",
+        **result,
+        "data": await run_in_threadpool(_latest_snapshot),
+    }
+
+@router.post("/backfill")
+async def backfill_prices(request: Request, chunk_size: int = Query(1000, ge=1, le=50000), db: Session = Depends(get_db)):
+    """
+    Carga histórica desde CSV enviado como cuerpo de la petición.
+    Columnas: commodity,price,unit,source,fetched_at (ISO 8601).
+    Se procesa por bloques: cada bloque es una transacción.
+
+    Ejemplo: curl -X POST --data-binary @bcrp.csv /prices/backfill
+    """
+    header = None
+    pending = []
+    first_row = 1
+    inserted = 0
+    errors = []
+
+    async def flush():
+        nonlocal inserted, pending, first_row
+        ticks, chunk_errors = parse_price_csv(header, pending, first_row)
+        inserted += await run_in_threadpool(create_prices_bulk, db, ticks)
+        errors.extend(chunk_errors)
+        first_row += len(pending)
+        pending = []
+
+    async for line in iter_request_lines(request):
+        if header is None:
+            header = [column.strip().lower() for column in next(csv.reader([line]))]
+            continue
+        pending.append(line)
+        if len(pending) >= chunk_size:
+            await flush()
+    if header is None:
+        raise HTTPException(status_code=400, detail="CSV vacío")
+    if pending:
+        await flush()
+
+    return {
+        "status": "success",
+        "inserted": inserted,
+        "rejected": len(errors),
+        "errors": errors[:100],
+    }
@@ -1,4 +1,5 @@
 from .buyer import BuyerBase, BuyerCreate, BuyerResponse
 from .price import PriceResponse
+from .alert import PriceAlertCreate, PriceAlertResponse
 
-__all__ = ["BuyerBase", "BuyerCreate", "BuyerResponse", "PriceResponse"]
+__all__ = ["BuyerBase", "BuyerCreate", "BuyerResponse", "PriceResponse", "PriceAlertCreate", "PriceAlertResponse"]
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from app.models.alert import AlertKind
+from app.models.price import CommodityType
+
+# Ventana máxima de las reglas porcentuales (30 días), dentro de la retención de agregados 1m
+ALERT_MAX_WINDOW_MINUTES = 30 * 24 * 60
+
+class PriceAlertCreate(BaseModel):
+    name: Optional[str] = None
+    commodity: CommodityType
+    kind: AlertKind
+    threshold: float
+    window_minutes: Optional[int] = Field(None, gt=0, le=ALERT_MAX_WINDOW_MINUTES)
+
+class PriceAlertResponse(PriceAlertCreate):
+    id: int
+    # Sin límites: las alertas ya guardadas se listan aunque no los cumplan
+    window_minutes: Optional[int] = None
+    active: bool
+    last_triggered_at: Optional[datetime]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
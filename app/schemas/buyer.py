@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
@@ -11,6 +11,8 @@ class BuyerBase(BaseModel):
     website: Optional[str] = None
     classification: str
     certificates: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class BuyerCreate(BuyerBase):
     pass
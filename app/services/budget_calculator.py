@@ -0,0 +1,209 @@
+"""
+Núcleo único del cálculo de presupuestos: /budgets/generate, BudgetBuyAgent y
+BudgetSellAgent usan estas fórmulas. Cada fórmula se escribe una sola vez con
+aritmética pura (_quote, _buy, _sell) y tiene dos entradas:
+- escalar (quote, buy_quote, sell_quote): floats de Python, sin costo de NumPy
+  por llamada;
+- por columnas (quote_columns, buy_columns, sell_columns): cada parámetro puede
+  ser escalar o array y se aplica con broadcasting, sin bucles por lote.
+Los valores de referencia están en tests/test_budget_calculator.py y el
+microbenchmark en benchmark_budgets.py.
+"""
+
+import numpy as np
+
+# Gramos por onza troy (precio USD/oz -> USD/kg en compra y venta)
+GRAMS_PER_TROY_OZ = 31.1035
+
+# Onzas troy por kg (valor redondeado que publica PriceAnalysisAgent)
+TROY_OZ_PER_KG = 32.151
+
+# IGV aplicado por BudgetBuyAgent
+IGV_RATE = 0.18
+
+# Ejes que admite el barrido de escenarios, en orden de dimensión de la grilla
+SWEEP_AXES = ("law_percentage", "recovery_percentage", "price_usd_oz", "fx_rate")
+
+# Límite de celdas por barrido (memoria: ~8 arrays float64 del tamaño de la grilla)
+SWEEP_MAX_CELLS = 2_000_000
+
+
+def _f64(value):
+    return np.asarray(value, dtype=np.float64)
+
+
+def _scalars(*values):
+    return [float(value) for value in values]
+
+
+def _usable_kg(quantity_kg, law_percentage, recovery_percentage):
+    return quantity_kg * (law_percentage / 100) * (recovery_percentage / 100)
+
+
+def _price_per_kg_pen(price_usd_oz, fx_rate):
+    return (price_usd_oz / GRAMS_PER_TROY_OZ) * fx_rate
+
+
+def _quote(quantity_kg, law_percentage, recovery_percentage, metal_price, fx_rate,
+           discounts_percentage, freight_cost_pen, taxes_percentage) -> dict:
+    # Se conserva el cálculo original de /generate: precio por oz x kg utilizables
+    usable_kg = _usable_kg(quantity_kg, law_percentage, recovery_percentage)
+    base_price_usd = metal_price * usable_kg
+    base_price_pen = base_price_usd * fx_rate
+    discounted_price = base_price_pen * (1 - discounts_percentage / 100)
+    net_before_tax = discounted_price + freight_cost_pen
+    taxes = net_before_tax * (taxes_percentage / 100)
+    return {
+        "usable_kg": usable_kg,
+        "base_price_usd": base_price_usd,
+        "base_price_pen": base_price_pen,
+        "discounted_price": discounted_price,
+        "net_before_tax": net_before_tax,
+        "taxes": taxes,
+        "final_amount": net_before_tax + taxes,
+    }
+
+
+def _buy(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+         freight_cost, commission_percentage) -> dict:
+    usable_weight = _usable_kg(weight_kg, law_percentage, recovery_percentage)
+    price_per_kg = _price_per_kg_pen(price_usd_oz, fx_rate)
+    gross_cost = usable_weight * price_per_kg
+    commission_cost = gross_cost * (commission_percentage / 100)
+    subtotal = gross_cost - freight_cost - commission_cost
+    igv = subtotal * IGV_RATE
+    return {
+        "usable_weight_kg": usable_weight,
+        "price_per_kg_pen": price_per_kg,
+        "gross_cost_pen": gross_cost,
+        "commission_cost_pen": commission_cost,
+        "subtotal_pen": subtotal,
+        "igv_pen": igv,
+        "total_pen": subtotal + igv,
+    }
+
+
+def _sell(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+          transport_cost, intermediary_percentage, taxes_percentage) -> dict:
+    usable_weight = _usable_kg(weight_kg, law_percentage, recovery_percentage)
+    price_per_kg = _price_per_kg_pen(price_usd_oz, fx_rate)
+    gross_income = usable_weight * price_per_kg
+    intermediary_cost = gross_income * (intermediary_percentage / 100)
+    taxes_cost = gross_income * (taxes_percentage / 100)
+    return {
+        "usable_weight_kg": usable_weight,
+        "price_per_kg_pen": price_per_kg,
+        "gross_income_pen": gross_income,
+        "intermediary_cost_pen": intermediary_cost,
+        "taxes_cost_pen": taxes_cost,
+        "net_income_pen": gross_income - transport_cost - intermediary_cost - taxes_cost,
+    }
+
+
+def quote(quantity_kg, law_percentage, recovery_percentage, metal_price, fx_rate,
+          discounts_percentage=0.0, freight_cost_pen=0.0, taxes_percentage=18.0) -> dict:
+    """Cotización de /budgets/generate para un solo lote."""
+    return _quote(*_scalars(quantity_kg, law_percentage, recovery_percentage, metal_price, fx_rate,
+                            discounts_percentage, freight_cost_pen, taxes_percentage))
+
+
+def quote_columns(quantity_kg, law_percentage, recovery_percentage, metal_price, fx_rate,
+                  discounts_percentage=0.0, freight_cost_pen=0.0, taxes_percentage=18.0) -> dict:
+    """Misma fórmula que quote, aplicada a columnas completas."""
+    return _quote(*map(_f64, (quantity_kg, law_percentage, recovery_percentage, metal_price, fx_rate,
+                              discounts_percentage, freight_cost_pen, taxes_percentage)))
+
+
+def buy_quote(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+              freight_cost=0.0, commission_percentage=3.0) -> dict:
+    """Presupuesto de compra (BudgetBuyAgent) para un solo lote."""
+    return _buy(*_scalars(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+                          freight_cost, commission_percentage))
+
+
+def buy_columns(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+                freight_cost=0.0, commission_percentage=3.0) -> dict:
+    """Misma fórmula que buy_quote, aplicada a columnas completas."""
+    return _buy(*map(_f64, (weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+                            freight_cost, commission_percentage)))
+
+
+def sell_quote(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+               transport_cost=100.0, intermediary_percentage=2.0, taxes_percentage=5.0) -> dict:
+    """Presupuesto de venta (BudgetSellAgent) para un solo lote."""
+    return _sell(*_scalars(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+                           transport_cost, intermediary_percentage, taxes_percentage))
+
+
+def sell_columns(weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+                 transport_cost=100.0, intermediary_percentage=2.0, taxes_percentage=5.0) -> dict:
+    """Misma fórmula que sell_quote, aplicada a columnas completas."""
+    return _sell(*map(_f64, (weight_kg, law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+                             transport_cost, intermediary_percentage, taxes_percentage)))
+
+
+def _generate_net(params: dict, law_percentage, recovery_percentage, price_usd_oz, fx_rate):
+    return quote_columns(
+        params["quantity_kg"], law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+        params.get("discounts_percentage", 0.0), params.get("freight_cost_pen", 0.0), params.get("taxes_percentage", 18.0),
+    )["final_amount"]
+
+
+def _buy_net(params: dict, law_percentage, recovery_percentage, price_usd_oz, fx_rate):
+    return buy_columns(
+        params["weight_kg"], law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+        params.get("freight_cost", 0.0), params.get("commission_percentage", 3.0),
+    )["total_pen"]
+
+
+def _sell_net(params: dict, law_percentage, recovery_percentage, price_usd_oz, fx_rate):
+    return sell_columns(
+        params["weight_kg"], law_percentage, recovery_percentage, price_usd_oz, fx_rate,
+        params.get("transport_cost", 100.0), params.get("intermediary_percentage", 2.0), params.get("taxes_percentage", 5.0),
+    )["net_income_pen"]
+
+
+# Modo -> (función del monto neto, nombre del monto en la respuesta del cálculo original)
+SWEEP_MODES = {
+    "generate": (_generate_net, "total_amount_pen"),
+    "buy": (_buy_net, "total_pen"),
+    "sell": (_sell_net, "net_income_pen"),
+}
+
+
+# Modo -> (parámetros fijos obligatorios, opcionales) que acepta 'params' fuera de SWEEP_AXES
+SWEEP_PARAMS = {
+    "generate": (("quantity_kg",), ("discounts_percentage", "freight_cost_pen", "taxes_percentage")),
+    "buy": (("weight_kg",), ("freight_cost", "commission_percentage")),
+    "sell": (("weight_kg",), ("transport_cost", "intermediary_percentage", "taxes_percentage")),
+}
+
+
+def sweep(mode: str, axes: dict, params: dict, break_even_target: float = None) -> dict:
+    """
+    Grilla cartesiana del monto neto sobre SWEEP_AXES calculada por broadcasting:
+    cada eje se reorienta a su propia dimensión y NumPy expande el resto.
+
+    El monto es afín en el precio (neto = a * precio + b), así que el precio de
+    equilibrio para un monto objetivo sale de evaluar con precio 0 y 1, sin
+    buscar raíces: una grilla sobre los ejes restantes (el del precio queda en 1).
+    """
+    net_fn, _ = SWEEP_MODES[mode]
+    ndim = len(SWEEP_AXES)
+    shaped = {}
+    for dim, name in enumerate(SWEEP_AXES):
+        shape = [1] * ndim
+        shape[dim] = -1
+        shaped[name] = _f64(axes[name]).reshape(shape)
+
+    grid = np.broadcast_to(net_fn(params, **shaped), tuple(len(axes[name]) for name in SWEEP_AXES))
+    result = {"grid": grid}
+
+    if break_even_target is not None:
+        others = {name: shaped[name] for name in SWEEP_AXES if name != "price_usd_oz"}
+        intercept = net_fn(params, price_usd_oz=0.0, **others)
+        slope = net_fn(params, price_usd_oz=1.0, **others) - intercept
+        with np.errstate(divide="ignore", invalid="ignore"):
+            break_even = (break_even_target - intercept) / slope
+        result["break_even_price_usd_oz"] = np.where(np.isfinite(break_even), break_even, np.nan)
+    return result
@@ -0,0 +1,142 @@
+"""
+Simulación Monte Carlo de presupuestos de compra/venta bajo volatilidad de
+precios y tipo de cambio. Volatilidades y correlaciones se estiman con los
+cierres diarios almacenados (agregados 1d); las trayectorias se generan de una
+vez como matriz (trayectorias x commodities).
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.price import PriceRollup, CommodityType
+from app.services.budget_calculator import buy_columns, sell_columns
+
+# Orden de las columnas de la matriz de retornos
+SIMULATED_COMMODITIES = (CommodityType.GOLD, CommodityType.SILVER, CommodityType.COPPER, CommodityType.USD_PEN)
+
+# Mínimo de retornos diarios alineados para estimar la covarianza
+MIN_RETURNS = 10
+
+# Modo -> (función de columnas, monto simulado)
+SIMULATION_MODES = {
+    "buy": (buy_columns, "total_pen"),
+    "sell": (sell_columns, "net_income_pen"),
+}
+
+# Valores por defecto de BudgetBuyAgent / BudgetSellAgent
+AGENT_DEFAULTS = {"weight_kg": 0.0, "law_percentage": 100.0, "recovery_percentage": 95.0}
+
+PERCENTILES = (5, 50, 95)
+
+
+class InsufficientHistoryError(ValueError):
+    pass
+
+
+def estimate_daily_covariance(db: Session, lookback_days: int = 365):
+    """
+    Covarianza de log-retornos diarios de todos los commodities, usando solo
+    los días en que hay cierre para todos. Devuelve (commodities, covarianza, n_retornos).
+    """
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    rows = db.execute(
+        select(PriceRollup.commodity, PriceRollup.bucket_start, PriceRollup.close)
+        .where(PriceRollup.bucket == "1d", PriceRollup.bucket_start >= since)
+    ).all()
+    closes = {}
+    for commodity, day, close in rows:
+        if close and close > 0:
+            closes.setdefault(commodity, {})[day] = close
+
+    commodities = [c for c in SIMULATED_COMMODITIES if len(closes.get(c, {})) > MIN_RETURNS]
+    if not commodities:
+        raise InsufficientHistoryError("Histórico de precios insuficiente para estimar volatilidad")
+    days = sorted(set.intersection(*(set(closes[c]) for c in commodities)))
+    if len(days) <= MIN_RETURNS:
+        raise InsufficientHistoryError("Pocos días con cierre para todos los commodities")
+
+    matrix = np.array([[closes[c][day] for c in commodities] for day in days], dtype=np.float64)
+    log_returns = np.diff(np.log(matrix), axis=0)
+    return commodities, np.atleast_2d(np.cov(log_returns, rowvar=False)), len(log_returns)
+
+
+def simulate_terminal_prices(spot: np.ndarray, daily_cov: np.ndarray, horizon_days: float, n_paths: int, seed: int = None) -> np.ndarray:
+    """
+    Precios al horizonte bajo GBM multivariado sin deriva (martingala):
+    S_T = S_0 * exp(-var/2 * T + sqrt(T) * L z), con L = cholesky(covarianza).
+    Devuelve una matriz (n_paths, n_commodities).
+    """
+    rng = np.random.default_rng(seed)
+    # jitter mínimo por si la covarianza es semidefinida (series colineales)
+    chol = np.linalg.cholesky(daily_cov + np.eye(len(daily_cov)) * 1e-12)
+    shocks = rng.standard_normal((n_paths, len(spot))) @ chol.T
+    drift = -0.5 * np.diag(daily_cov) * horizon_days
+    return spot * np.exp(drift + np.sqrt(horizon_days) * shocks)
+
+
+def simulate_budget(db: Session, mode: str, mineral: CommodityType, params: dict, spot: dict,
+                    n_paths: int = 100_000, horizon_days: float = 30, lookback_days: int = 365, seed: int = None) -> dict:
+    """
+    Distribución del monto del presupuesto (total_pen en compra, net_income_pen
+    en venta) con precio del metal y USD/PEN simulados de forma correlacionada.
+    spot: precio inicial por commodity (como mínimo el mineral y USD/PEN).
+    """
+    columns_fn, amount_name = SIMULATION_MODES[mode]
+    params = {**AGENT_DEFAULTS, **params}
+    commodities, daily_cov, n_returns = estimate_daily_covariance(db, lookback_days)
+    for required in (mineral, CommodityType.USD_PEN):
+        if required not in commodities:
+            raise InsufficientHistoryError(f"Histórico insuficiente para {required.value}")
+        if not spot.get(required):
+            raise InsufficientHistoryError(f"Precio inicial no disponible para {required.value}")
+
+    # Commodities sin precio inicial se excluyen del sorteo (no afectan al presupuesto)
+    keep = [i for i, c in enumerate(commodities) if spot.get(c)]
+    commodities = [commodities[i] for i in keep]
+    daily_cov = daily_cov[np.ix_(keep, keep)]
+    spot_vector = np.array([spot[c] for c in commodities], dtype=np.float64)
+    paths = simulate_terminal_prices(spot_vector, daily_cov, horizon_days, n_paths, seed)
+
+    metal = paths[:, commodities.index(mineral)]
+    fx = paths[:, commodities.index(CommodityType.USD_PEN)]
+    amounts = columns_fn(price_usd_oz=metal, fx_rate=fx, **params)[amount_name]
+    base = float(columns_fn(price_usd_oz=spot[mineral], fx_rate=spot[CommodityType.USD_PEN], **params)[amount_name])
+
+    p5, p50, p95 = np.percentile(amounts, PERCENTILES)
+    # Riesgo: en venta, recibir menos; en compra, pagar más
+    var_95 = base - p5 if mode == "sell" else p95 - base
+    volatility = np.sqrt(np.diag(daily_cov))
+    # Una serie plana (volatilidad 0) no tiene correlación definida: se informa 0
+    scale = np.outer(volatility, volatility)
+    correlation = np.divide(daily_cov, scale, out=np.zeros_like(daily_cov), where=scale > 0)
+    np.fill_diagonal(correlation, 1.0)
+
+    return {
+        "amount": amount_name,
+        "base": base,
+        "mean": float(amounts.mean()),
+        "std": float(amounts.std()),
+        "p5": float(p5),
+        "p50": float(p50),
+        "p95": float(p95),
+        "var_95": float(var_95),
+        "n_paths": n_paths,
+        "horizon_days": horizon_days,
+        "seed": seed,
+        "estimation": {
+            "lookback_days": lookback_days,
+            "daily_returns": n_returns,
+            "commodities": [c.value for c in commodities],
+            "daily_volatility": volatility.tolist(),
+            "correlation": correlation.tolist(),
+        },
+        "prices": {
+            c.value: {
+                "spot": float(spot_vector[i]),
+                "p5": float(np.percentile(paths[:, i], 5)),
+                "p95": float(np.percentile(paths[:, i], 95)),
+            }
+            for i, c in enumerate(commodities)
+        },
+    }
@@ -0,0 +1,188 @@
+"""
+Motor de indicadores técnicos vectorizados (NumPy) sobre el histórico de precios.
+Todas las funciones operan sobre arrays float64 completos, sin bucles por fila.
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.price import Price, CommodityType
+from app.utils.tick_store import to_epoch
+
+# Bloque para el cálculo cerrado de la EMA: acota decay^-k y evita overflow
+_EMA_BLOCK = 64
+
+# Banda (en %) dentro de la cual la tendencia se considera estable
+TREND_BAND_PCT = 0.25
+
+
+def load_price_history(db: Session, commodities=None, since: datetime = None) -> dict:
+    """
+    Lee en una sola consulta el histórico de varios commodities y lo separa en
+    arrays (timestamps epoch, precios) por commodity, ordenados por fecha.
+    """
+    commodities = list(commodities or CommodityType)
+    query = (
+        select(Price.commodity, Price.fetched_at, Price.price)
+        .where(Price.commodity.in_(commodities), Price.price.is_not(None))
+        .order_by(Price.commodity, Price.fetched_at)
+    )
+    if since is not None:
+        query = query.where(Price.fetched_at >= since)
+    rows = db.execute(query).all()
+
+    history = {commodity: (np.empty(0), np.empty(0)) for commodity in commodities}
+    if not rows:
+        return history
+    names, stamps, prices = zip(*rows)
+    codes = np.array([commodities.index(name) for name in names])
+    ts = np.fromiter((to_epoch(stamp) for stamp in stamps), dtype=np.float64, count=len(stamps))
+    px = np.asarray(prices, dtype=np.float64)
+    # El orden de commodity depende del motor (nombre en SQLite, ordinal del ENUM
+    # en Postgres): un argsort estable deja cada commodity en un rango contiguo
+    order = np.argsort(codes, kind="stable")
+    codes, ts, px = codes[order], ts[order], px[order]
+    bounds = np.searchsorted(codes, np.arange(len(commodities) + 1))
+    for i, commodity in enumerate(commodities):
+        history[commodity] = (ts[bounds[i]:bounds[i + 1]], px[bounds[i]:bounds[i + 1]])
+    return history
+
+
+def returns(px: np.ndarray) -> np.ndarray:
+    """Retornos simples entre muestras consecutivas."""
+    if len(px) < 2:
+        return np.empty(0)
+    return px[1:] / px[:-1] - 1
+
+
+def sma(px: np.ndarray, window: int) -> np.ndarray:
+    """Media móvil simple; el resultado tiene len(px) - window + 1 elementos."""
+    if len(px) < window:
+        return np.empty(0)
+    csum = np.cumsum(np.concatenate(([0.0], px)))
+    return (csum[window:] - csum[:-window]) / window
+
+
+def ema(px: np.ndarray, span: int) -> np.ndarray:
+    """
+    Media móvil exponencial (alpha = 2 / (span + 1), sin ajuste de sesgo).
+    Usa la forma cerrada y = decay^(j+1) * (prev + alpha * cumsum(x * decay^-(i+1)))
+    por bloques, así solo se itera una vez cada _EMA_BLOCK muestras.
+    """
+    n = len(px)
+    out = np.empty(n)
+    if not n:
+        return out
+    alpha = 2.0 / (span + 1)
+    decay = 1.0 - alpha
+    powers = decay ** np.arange(1, _EMA_BLOCK + 1)
+    out[0] = prev = px[0]
+    for start in range(1, n, _EMA_BLOCK):
+        block = px[start:start + _EMA_BLOCK]
+        p = powers[:len(block)]
+        out[start:start + len(block)] = p * (prev + alpha * np.cumsum(block / p))
+        prev = out[start + len(block) - 1]
+    return out
+
+
+def rolling_volatility(px: np.ndarray, window: int) -> np.ndarray:
+    """Desviación estándar móvil de los retornos (sumas acumuladas, O(n))."""
+    r = returns(px)
+    if len(r) < window:
+        return np.empty(0)
+    c1 = np.cumsum(np.concatenate(([0.0], r)))
+    c2 = np.cumsum(np.concatenate(([0.0], r * r)))
+    mean = (c1[window:] - c1[:-window]) / window
+    var = (c2[window:] - c2[:-window]) / window - mean * mean
+    return np.sqrt(np.maximum(var, 0.0))
+
+
+def drawdown(px: np.ndarray) -> np.ndarray:
+    """Caída relativa respecto al máximo acumulado (0 en máximos, negativa en caídas)."""
+    if not len(px):
+        return np.empty(0)
+    return px / np.maximum.accumulate(px) - 1
+
+
+def convert_currency(ts: np.ndarray, px: np.ndarray, fx_ts: np.ndarray, fx: np.ndarray) -> np.ndarray:
+    """
+    Convierte una serie en USD a PEN usando el tipo de cambio vigente en cada
+    instante (as-of join con searchsorted). Sin tipo de cambio previo: NaN.
+    """
+    if not len(fx):
+        return np.full(len(px), np.nan)
+    idx = np.searchsorted(fx_ts, ts, side="right") - 1
+    rate = np.where(idx >= 0, fx[np.clip(idx, 0, None)], np.nan)
+    return px * rate
+
+
+def trend_label(short_ma: float, long_ma: float) -> str:
+    if not np.isfinite(short_ma) or not np.isfinite(long_ma) or not long_ma:
+        return "desconocido"
+    diff_pct = (short_ma / long_ma - 1) * 100
+    if diff_pct > TREND_BAND_PCT:
+        return "al alza"
+    if diff_pct < -TREND_BAND_PCT:
+        return "a la baja"
+    return "estable"
+
+
+def _last(values: np.ndarray):
+    return float(values[-1]) if len(values) else None
+
+
+def compute_indicators(history: dict, short_window: int = 5, long_window: int = 20, vol_window: int = 20, include_series: bool = False) -> dict:
+    """Calcula los indicadores de todos los commodities cargados por load_price_history."""
+    fx_ts, fx = history.get(CommodityType.USD_PEN, (np.empty(0), np.empty(0)))
+    results = {}
+    for commodity, (ts, px) in history.items():
+        if not len(px):
+            results[commodity.value] = {"points": 0, "trend": "desconocido"}
+            continue
+        short_ma = sma(px, short_window)
+        long_ma = sma(px, long_window)
+        ema_series = ema(px, long_window)
+        vol = rolling_volatility(px, vol_window)
+        dd = drawdown(px)
+        r = returns(px)
+        result = {
+            "points": int(len(px)),
+            "from": datetime.utcfromtimestamp(ts[0]),
+            "to": datetime.utcfromtimestamp(ts[-1]),
+            "last": float(px[-1]),
+            "sma_short": _last(short_ma),
+            "sma_long": _last(long_ma),
+            "ema": _last(ema_series),
+            "return_last": _last(r),
+            "return_period": float(px[-1] / px[0] - 1) if px[0] else None,
+            "volatility": _last(vol),
+            "drawdown": _last(dd),
+            "max_drawdown": float(dd.min()),
+            "trend": trend_label(_last(short_ma) or np.nan, _last(long_ma) or np.nan),
+        }
+        if commodity != CommodityType.USD_PEN:
+            pen = convert_currency(ts, px, fx_ts, fx)
+            result["last_pen"] = None if np.isnan(pen[-1]) else float(pen[-1])
+            if include_series:
+                result["series_pen"] = np.where(np.isnan(pen), None, pen).tolist()
+        if include_series:
+            result["series"] = {
+                "t": ts.tolist(),
+                "price": px.tolist(),
+                "sma_short": short_ma.tolist(),
+                "sma_long": long_ma.tolist(),
+                "ema": ema_series.tolist(),
+                "volatility": vol.tolist(),
+                "drawdown": dd.tolist(),
+            }
+        results[commodity.value] = result
+    return results
+
+
+def analyze(db: Session, commodities=None, lookback_days: int = 90, **kwargs) -> dict:
+    """Carga el histórico reciente y calcula indicadores en una sola pasada."""
+    commodities = set(commodities or CommodityType)
+    commodities.add(CommodityType.USD_PEN)  # necesario para las series en PEN
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    return compute_indicators(load_price_history(db, commodities, since), **kwargs)
@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, desc
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.crud.alert import get_active_alerts, record_alert_events
+from app.models.alert import AlertKind, PriceAlert
+from app.models.price import Price, PriceRollup
+from app.services.price_stream import PriceBroadcaster
+from app.utils.logger import logger
+from app.utils.tick_store import TickStore, to_epoch
+
+settings = get_settings()
+
+# Ventana por defecto de las reglas porcentuales (minutos)
+DEFAULT_WINDOW_MINUTES = 60
+
+
+class AlertEngine:
+    """
+    Motor incremental de alertas de precio. Las reglas activas se indexan en
+    memoria por commodity; cada tick evalúa solo las reglas de su commodity.
+    Las alertas se disparan por flanco: una regla que ya se disparó vuelve a
+    armarse cuando su condición deja de cumplirse. El estado se deriva de BD
+    (tick anterior y last_triggered_at), así no depende del proceso que
+    evalúa (API o worker) ni se pierde al reiniciar.
+    """
+
+    _rules: dict = {}  # CommodityType -> lista de reglas
+    _loaded_at = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def invalidate():
+        AlertEngine._loaded_at = None
+
+    @staticmethod
+    def _ensure_loaded(db: Session):
+        loaded_at = AlertEngine._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < settings.alert_rules_ttl_seconds:
+            return
+        rules = {}
+        for alert in get_active_alerts(db):
+            rules.setdefault(alert.commodity, []).append({
+                "id": alert.id,
+                "name": alert.name,
+                "kind": alert.kind,
+                "threshold": alert.threshold,
+                "window_minutes": alert.window_minutes or DEFAULT_WINDOW_MINUTES,
+            })
+        with AlertEngine._lock:
+            AlertEngine._rules = rules
+            AlertEngine._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _reference_price(db: Session, commodity, at: datetime):
+        """Precio vigente en 'at': primero el tick store en memoria, luego el agregado 1m (un seek)."""
+        ts, px = TickStore.last(commodity)
+        cutoff = to_epoch(at)
+        if len(ts) and ts[0] <= cutoff:
+            return float(px[np.searchsorted(ts, cutoff, side="right") - 1])
+        return db.execute(
+            select(PriceRollup.close)
+            .where(
+                PriceRollup.commodity == commodity,
+                PriceRollup.bucket == "1m",
+                PriceRollup.bucket_start <= at,
+            )
+            .order_by(desc(PriceRollup.bucket_start))
+            .limit(1)
+        ).scalar()
+
+    @staticmethod
+    def _check(db: Session, rule: dict, tick: dict, references: dict):
+        """Devuelve (cumple, valor observado) para una regla y un tick."""
+        price = tick["price"]
+        kind = rule["kind"]
+        if kind == AlertKind.ABOVE:
+            return price >= rule["threshold"], price
+        if kind == AlertKind.BELOW:
+            return price <= rule["threshold"], price
+
+        window = rule["window_minutes"]
+        if window not in references:
+            at = tick["fetched_at"] - timedelta(minutes=window)
+            references[window] = AlertEngine._reference_price(db, tick["commodity"], at)
+        reference = references[window]
+        if not reference:
+            return False, None
+        change_pct = (price / reference - 1) * 100
+        if kind == AlertKind.PCT_UP:
+            return change_pct >= rule["threshold"], change_pct
+        return change_pct <= -rule["threshold"], change_pct
+
+    @staticmethod
+    def _previous_tick(db: Session, commodity, before: datetime):
+        """Última cotización almacenada del commodity anterior a 'before' (un seek)."""
+        row = db.execute(
+            select(Price.price, Price.fetched_at)
+            .where(Price.commodity == commodity, Price.price.is_not(None), Price.fetched_at < before)
+            .order_by(desc(Price.fetched_at))
+            .limit(1)
+        ).first()
+        return {"commodity": commodity, "price": row.price, "fetched_at": row.fetched_at} if row else None
+
+    @staticmethod
+    def _disarmed(db: Session, rules: list, previous: dict) -> set:
+        """
+        Reglas desarmadas al llegar el primer tick: su condición ya se cumplía en
+        el tick anterior y ya se dispararon alguna vez. Una regla que nunca se
+        disparó está armada aunque se haya creado con la condición cumplida.
+        """
+        if previous is None:
+            return set()
+        references = {}
+        hit_ids = [rule["id"] for rule in rules if AlertEngine._check(db, rule, previous, references)[0]]
+        if not hit_ids:
+            return set()
+        return set(db.execute(
+            select(PriceAlert.id).where(PriceAlert.id.in_(hit_ids), PriceAlert.last_triggered_at.is_not(None))
+        ).scalars())
+
+    @staticmethod
+    def evaluate(db: Session, ticks: list) -> list:
+        """Evalúa un conjunto de ticks recién almacenados, registra y publica las alertas disparadas."""
+        AlertEngine._ensure_loaded(db)
+        by_commodity = {}
+        for tick in ticks:
+            if tick.get("price") is not None and AlertEngine._rules.get(tick["commodity"]):
+                by_commodity.setdefault(tick["commodity"], []).append(tick)
+
+        fired = []
+        for commodity, group in by_commodity.items():
+            group.sort(key=lambda tick: tick["fetched_at"])
+            rules = AlertEngine._rules[commodity]
+            previous = AlertEngine._previous_tick(db, commodity, group[0]["fetched_at"])
+            disarmed = AlertEngine._disarmed(db, rules, previous)
+            for tick in group:
+                references = {}
+                for rule in rules:
+                    hit, observed = AlertEngine._check(db, rule, tick, references)
+                    if hit and rule["id"] not in disarmed:
+                        fired.append({
+                            "alert_id": rule["id"],
+                            "name": rule["name"],
+                            "commodity": commodity,
+                            "kind": rule["kind"],
+                            "threshold": rule["threshold"],
+                            "window_minutes": rule["window_minutes"] if rule["kind"] in (AlertKind.PCT_UP, AlertKind.PCT_DOWN) else None,
+                            "observed": observed,
+                            "price": tick["price"],
+                            "triggered_at": tick["fetched_at"],
+                        })
+                    if hit:
+                        disarmed.add(rule["id"])
+                    else:
+                        disarmed.discard(rule["id"])
+
+        if fired:
+            for event, event_id in zip(fired, record_alert_events(db, fired)):
+                event["id"] = event_id
+            PriceBroadcaster.publish_alerts(fired)
+            logger.info(f"🔔 {len(fired)} alertas de precio disparadas")
+        return fired
@@ -0,0 +1,106 @@
+"""
+Serialización en streaming del histórico de precios (CSV / Parquet).
+Cada lote leído de la BD se convierte y se envía de inmediato, así la memoria
+usada depende del tamaño del lote y no del total de filas exportadas.
+"""
+
+import csv
+import io
+from app.crud.price import iter_price_rows
+from app.database import SessionLocal
+
+EXPORT_COLUMNS = ["commodity", "price", "unit", "source", "fetched_at"]
+
+
+def _iter_batches(commodity, start, end, batch_size):
+    # Sesión propia: vive lo que dure el stream, no la petición
+    db = SessionLocal()
+    try:
+        yield from iter_price_rows(db, commodity, start, end, batch_size)
+    finally:
+        db.close()
+
+
+def iter_csv(commodity=None, start=None, end=None, batch_size: int = 5000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for batch in _iter_batches(commodity, start, end, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (row.commodity.value, row.price, row.unit, row.source, row.fetched_at.isoformat() if row.fetched_at else "")
+            for row in batch
+        )
+        yield buffer.getvalue()
+
+
+class _StreamSink:
+    """
+    Destino de escritura para ParquetWriter que entrega lo escrito por partes.
+    tell() informa el total acumulado: Parquet registra offsets absolutos en el footer.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def iter_parquet(commodity=None, start=None, end=None, batch_size: int = 50000):
+    """Un row group por lote; requiere pyarrow (dependencia opcional)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("commodity", pa.string()),
+        ("price", pa.float64()),
+        ("unit", pa.string()),
+        ("source", pa.string()),
+        ("fetched_at", pa.timestamp("us")),
+    ])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for batch in _iter_batches(commodity, start, end, batch_size):
+            commodities, prices, units, sources, stamps = zip(*batch)
+            writer.write_table(pa.table([
+                pa.array([c.value for c in commodities], pa.string()),
+                pa.array(prices, pa.float64()),
+                pa.array(units, pa.string()),
+                pa.array(sources, pa.string()),
+                pa.array(stamps, pa.timestamp("us")),
+            ], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -1,33 +1,69 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+import httpx
 import requests
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.crud.price import create_price
+from app.crud.price import create_prices_bulk
+from app.database import SessionLocal
 from app.models.price import CommodityType
+from app.services.price_stream import PriceBroadcaster
+from app.services.price_alerts import AlertEngine
 from app.utils.logger import AuditLog, logger
 from app.config import get_settings
 
 settings = get_settings()
 
+BCRP_FX_URL = "https://www.bcrp.gob.pe/webservices/GetTipoCambio"
+METALS_URL = "https://api.metals.live/v1/spot/metals?currencies=USD"
+
+# Marca de respuesta 304: la fuente no tiene datos nuevos
+NOT_MODIFIED = object()
+
 class PriceFetcher:
+    # Cliente HTTP compartido (keep-alive) para el camino asíncrono
+    _async_client: Optional[httpx.AsyncClient] = None
+
+    # Single-flight de /prices/refresh y validadores HTTP (ETag / Last-Modified) por URL
+    _refresh_task: Optional[asyncio.Task] = None
+    _last_refresh_at: Optional[float] = None
+    _validators: dict = {}
+
+    @staticmethod
+    def _parse_bcrp(data: dict) -> dict:
+        # BCRP devuelve XML; parsear según formato actual
+        # Placeholder: asumir formato JSON
+        return {
+            "rate": data.get("Moneda", [{}])[0].get("Venta", 0),
+            "source": "BCRP",
+            "currency_pair": "USD/PEN"
+        }
+
+    @staticmethod
+    def _parse_metals(data: dict) -> dict:
+        return {
+            "gold": data.get("metals", {}).get("gold"),
+            "silver": data.get("metals", {}).get("silver"),
+            "copper": data.get("metals", {}).get("copper"),
+            "source": "Metals.Live",
+            "unit": "USD/oz"
+        }
+
     @staticmethod
     def fetch_bcrp_fx_rate() -> dict:
         """Obtiene tasa USD/PEN del BCRP (Banco Central de Reserva del Perú)."""
+        url = BCRP_FX_URL
         try:
             # BCRP tiene una API pública
-            url = "https://www.bcrp.gob.pe/webservices/GetTipoCambio"
             params = {"idioma": "1"}
             response = requests.get(url, params=params, timeout=10)
-            
+
             AuditLog.log_api_call("BCRP", url, response.status_code)
-            
+
             if response.status_code == 200:
-                # BCRP devuelve XML; parsear según formato actual
-                # Placeholder: asumir formato JSON
-                data = response.json()
-                return {
-                    "rate": data.get("Moneda", [{}])[0].get("Venta", 0),
-                    "source": "BCRP",
-                    "currency_pair": "USD/PEN"
-                }
+                return PriceFetcher._parse_bcrp(response.json())
         except Exception as e:
             logger.error(f"Error fetching BCRP FX rate: {str(e)}")
             AuditLog.log_api_call("BCRP", url, error=str(e))
@@ -36,36 +72,164 @@ class PriceFetcher:
     @staticmethod
     def fetch_metals_prices() -> dict:
         """Obtiene precios de metales (oro, plata, cobre)."""
+        url = METALS_URL
         try:
             # Usar metals-api.com (requiere key) o Yahoo Finance
-            url = "https://api.metals.live/v1/spot/metals?currencies=USD"
             response = requests.get(url, timeout=10)
-            
+
             AuditLog.log_api_call("Metals.Live", url, response.status_code)
-            
+
             if response.status_code == 200:
-                data = response.json()
-                return {
-                    "gold": data.get("metals", {}).get("gold"),
-                    "silver": data.get("metals", {}).get("silver"),
-                    "copper": data.get("metals", {}).get("copper"),
-                    "source": "Metals.Live",
-                    "unit": "USD/oz"
-                }
+                return PriceFetcher._parse_metals(response.json())
         except Exception as e:
             logger.error(f"Error fetching metals prices: {str(e)}")
             AuditLog.log_api_call("Metals.Live", url, error=str(e))
         return None
 
+    @staticmethod
+    def get_async_client() -> httpx.AsyncClient:
+        """Devuelve el cliente httpx compartido, creándolo si hace falta."""
+        if PriceFetcher._async_client is None or PriceFetcher._async_client.is_closed:
+            PriceFetcher._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=120),
+            )
+        return PriceFetcher._async_client
+
+    @staticmethod
+    async def close_async_client():
+        if PriceFetcher._async_client is not None:
+            await PriceFetcher._async_client.aclose()
+            PriceFetcher._async_client = None
+
+    @staticmethod
+    async def _get_json_async(client: httpx.AsyncClient, service: str, url: str, timeout: float, params: dict = None):
+        """
+        GET condicional con límite de tiempo total por fuente.
+        Devuelve el JSON, NOT_MODIFIED ante un 304, o None ante cualquier fallo.
+        """
+        validators = PriceFetcher._validators.get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            response = await asyncio.wait_for(client.get(url, params=params, headers=headers, timeout=timeout), timeout)
+            AuditLog.log_api_call(service, url, response.status_code)
+            if response.status_code == 304:
+                return NOT_MODIFIED
+            if response.status_code == 200:
+                PriceFetcher._validators[url] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                return response.json()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Error fetching {service}: {error}")
+            AuditLog.log_api_call(service, url, error=error)
+        return None
+
+    @staticmethod
+    async def fetch_bcrp_fx_rate_async(client: httpx.AsyncClient = None) -> dict:
+        """Versión asíncrona de fetch_bcrp_fx_rate (NOT_MODIFIED si BCRP responde 304)."""
+        data = await PriceFetcher._get_json_async(
+            client or PriceFetcher.get_async_client(), "BCRP", BCRP_FX_URL,
+            settings.bcrp_timeout_seconds, params={"idioma": "1"},
+        )
+        return PriceFetcher._parse_bcrp(data) if data not in (None, NOT_MODIFIED) else data
+
+    @staticmethod
+    async def fetch_metals_prices_async(client: httpx.AsyncClient = None) -> dict:
+        """Versión asíncrona de fetch_metals_prices (NOT_MODIFIED si la fuente responde 304)."""
+        data = await PriceFetcher._get_json_async(
+            client or PriceFetcher.get_async_client(), "Metals.Live", METALS_URL,
+            settings.metals_timeout_seconds,
+        )
+        return PriceFetcher._parse_metals(data) if data not in (None, NOT_MODIFIED) else data
+
+    @staticmethod
+    async def fetch_all_async(client: httpx.AsyncClient = None):
+        """Consulta todas las fuentes en paralelo: el costo es el de la más lenta."""
+        return await asyncio.gather(
+            PriceFetcher.fetch_bcrp_fx_rate_async(client),
+            PriceFetcher.fetch_metals_prices_async(client),
+        )
+
+    @staticmethod
+    def _build_ticks(fx_data: dict, metals_data: dict) -> list:
+        fetched_at = datetime.utcnow()
+        ticks = []
+        # None (falla) o NOT_MODIFIED (304): nada nuevo de esa fuente
+        if isinstance(fx_data, dict):
+            ticks.append({"commodity": CommodityType.USD_PEN, "price": fx_data["rate"], "unit": "PEN/USD", "source": fx_data["source"], "fetched_at": fetched_at})
+        if isinstance(metals_data, dict):
+            for commodity, key in ((CommodityType.GOLD, "gold"), (CommodityType.SILVER, "silver"), (CommodityType.COPPER, "copper")):
+                ticks.append({"commodity": commodity, "price": metals_data[key], "unit": metals_data["unit"], "source": metals_data["source"], "fetched_at": fetched_at})
+        # Una fuente sin cotización para un commodity no genera tick
+        return [tick for tick in ticks if tick["price"] is not None]
+
+    @staticmethod
+    def _record_ticks(db: Session, ticks: list) -> int:
+        """Persiste el conjunto de cotizaciones, lo difunde a los suscriptores y evalúa alertas."""
+        stored = create_prices_bulk(db, ticks)
+        PriceBroadcaster.publish_ticks(ticks)
+        try:
+            AlertEngine.evaluate(db, ticks)
+        except Exception as e:
+            # Una falla en alertas no debe invalidar precios ya almacenados
+            db.rollback()
+            logger.error(f"Error evaluating price alerts: {str(e)}")
+        return stored
+
+    @staticmethod
+    async def _refresh_once() -> int:
+        # Sesión propia: la tarea compartida no depende de la petición que la inició
+        fx_data, metals_data = await PriceFetcher.fetch_all_async()
+        ticks = PriceFetcher._build_ticks(fx_data, metals_data)
+
+        def record():
+            db = SessionLocal()
+            try:
+                return PriceFetcher._record_ticks(db, ticks)
+            finally:
+                db.close()
+
+        stored = await run_in_threadpool(record)
+        # La ventana de frescura empieza si alguna fuente respondió (también con
+        # 304: confirma que lo guardado está al día); si todas fallaron, el
+        # siguiente refresh vuelve a consultar
+        if fx_data is not None or metals_data is not None:
+            PriceFetcher._last_refresh_at = time.monotonic()
+        return stored
+
+    @staticmethod
+    async def refresh(force: bool = False) -> dict:
+        """
+        Refresh coalescido (single-flight): las llamadas concurrentes esperan la
+        misma consulta en curso, y dentro de la ventana de frescura no se
+        consulta a las fuentes.
+        """
+        last = PriceFetcher._last_refresh_at
+        if not force and last is not None and time.monotonic() - last < settings.price_refresh_min_interval_seconds:
+            return {"refreshed": False, "coalesced": False, "stored": 0}
+
+        task = PriceFetcher._refresh_task
+        coalesced = task is not None and not task.done()
+        if not coalesced:
+            task = PriceFetcher._refresh_task = asyncio.ensure_future(PriceFetcher._refresh_once())
+        # shield: si un llamador se desconecta, la consulta sigue para los demás
+        stored = await asyncio.shield(task)
+        return {"refreshed": True, "coalesced": coalesced, "stored": stored}
+
+    @staticmethod
+    async def _fetch_all_standalone():
+        # Fuera del event loop de la API (Celery) se usa un cliente propio del loop temporal
+        async with httpx.AsyncClient() as client:
+            return await PriceFetcher.fetch_all_async(client)
+
     @staticmethod
     def store_prices(db: Session):
-        """Obtiene y almacena precios actuales en BD."""
-        fx_data = PriceFetcher.fetch_bcrp_fx_rate()
-        if fx_data:
-            create_price(db, CommodityType.USD_PEN, fx_data["rate"], "PEN/USD", fx_data["source"])
-        
-        metals_data = PriceFetcher.fetch_metals_prices()
-        if metals_data:
-            create_price(db, CommodityType.GOLD, metals_data["gold"], metals_data["unit"], metals_data["source"])
-            create_price(db, CommodityType.SILVER, metals_data["silver"], metals_data["unit"], metals_data["source"])
-            create_price(db, CommodityType.COPPER, metals_data["copper"], metals_data["unit"], metals_data["source"])
+        """Obtiene y almacena precios actuales en BD (una sola transacción)."""
+        fx_data, metals_data = asyncio.run(PriceFetcher._fetch_all_standalone())
+        return PriceFetcher._record_ticks(db, PriceFetcher._build_ticks(fx_data, metals_data))
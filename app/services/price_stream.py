@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from app.config import get_settings
+from app.crud.alert import get_alert_events, get_last_alert_event_id
+from app.crud.price import load_latest_prices
+from app.database import SessionLocal
+from app.utils.logger import logger
+
+settings = get_settings()
+
+
+class PriceBroadcaster:
+    """
+    Difusión en memoria (fan-out) de cotizaciones hacia suscriptores SSE.
+    Cada mensaje se serializa una sola vez y se entrega a todas las colas,
+    así una escritura en BD llega a N clientes sin N consultas.
+
+    Los ticks y alertas registrados en este proceso se publican al instante.
+    Los de otros procesos (worker de Celery, otros workers de uvicorn) los
+    detecta un watcher que consulta en BD la última cotización (mientras haya
+    suscriptores) y los disparos nuevos de price_alert_events cada
+    PRICE_STREAM_POLL_SECONDS.
+    """
+
+    QUEUE_SIZE = 100
+
+    # cola -> event loop al que pertenece (publish puede venir de otro hilo)
+    _subscribers: dict = {}
+    _lock = threading.Lock()
+
+    # Última fecha publicada por commodity: evita reenviar un tick ya difundido
+    _last_sent: dict = {}
+    _watcher: Optional[asyncio.Task] = None
+
+    # Disparos: último id visto por el watcher e ids ya publicados localmente
+    _alert_cursor: int = 0
+    _alerts_sent: set = set()
+
+    @staticmethod
+    def subscribe() -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=PriceBroadcaster.QUEUE_SIZE)
+        with PriceBroadcaster._lock:
+            PriceBroadcaster._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    @staticmethod
+    def unsubscribe(queue: asyncio.Queue):
+        with PriceBroadcaster._lock:
+            PriceBroadcaster._subscribers.pop(queue, None)
+
+    @staticmethod
+    def subscriber_count() -> int:
+        return len(PriceBroadcaster._subscribers)
+
+    @staticmethod
+    def format_event(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: str):
+        # Un cliente lento no bloquea a los demás: se descarta su mensaje más antiguo
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(message)
+
+    @staticmethod
+    def publish(event: str, data):
+        """Encola un evento para todos los suscriptores; seguro desde cualquier hilo."""
+        with PriceBroadcaster._lock:
+            subscribers = list(PriceBroadcaster._subscribers.items())
+        if not subscribers:
+            return
+        message = PriceBroadcaster.format_event(event, data)
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(PriceBroadcaster._offer, queue, message)
+            except RuntimeError:
+                # loop cerrado: el suscriptor ya no existe
+                PriceBroadcaster.unsubscribe(queue)
+        logger.debug(f"Evento {event} enviado a {len(subscribers)} suscriptores")
+
+    @staticmethod
+    def _unsent(ticks: list) -> list:
+        with PriceBroadcaster._lock:
+            fresh = []
+            for tick in ticks:
+                last = PriceBroadcaster._last_sent.get(tick["commodity"])
+                fetched_at = tick.get("fetched_at")
+                if last is None or fetched_at is None or fetched_at > last:
+                    fresh.append(tick)
+                    if fetched_at is not None:
+                        PriceBroadcaster._last_sent[tick["commodity"]] = fetched_at
+            return fresh
+
+    @staticmethod
+    def publish_ticks(ticks: list):
+        """Publica un conjunto de cotizaciones con el mismo formato que /prices/latest."""
+        ticks = PriceBroadcaster._unsent(ticks)
+        if ticks:
+            PriceBroadcaster.publish("prices", {
+                tick["commodity"].value: {"price": tick["price"], "unit": tick.get("unit"), "fetched_at": tick.get("fetched_at")}
+                for tick in ticks
+            })
+
+    @staticmethod
+    def publish_alerts(events: list):
+        """Publica disparos ya registrados en BD (dicts con su 'id')."""
+        with PriceBroadcaster._lock:
+            if PriceBroadcaster._watcher is not None:
+                # El watcher los verá en la tabla: que no los reenvíe
+                PriceBroadcaster._alerts_sent.update(event["id"] for event in events)
+        for event in events:
+            PriceBroadcaster.publish("alert", event)
+
+    @staticmethod
+    def _load_alert_events(after_id: int) -> list:
+        db = SessionLocal()
+        try:
+            return get_alert_events(db, after_id=after_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _last_alert_event_id() -> int:
+        db = SessionLocal()
+        try:
+            return get_last_alert_event_id(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _publish_new_alerts(events: list):
+        with PriceBroadcaster._lock:
+            pending = [event for event in events if event["id"] not in PriceBroadcaster._alerts_sent]
+            PriceBroadcaster._alerts_sent.difference_update(event["id"] for event in events)
+            if events:
+                PriceBroadcaster._alert_cursor = max(PriceBroadcaster._alert_cursor, events[-1]["id"])
+        for event in pending:
+            PriceBroadcaster.publish("alert", event)
+
+    @staticmethod
+    def _load_latest() -> list:
+        db = SessionLocal()
+        try:
+            return [snapshot._asdict() for snapshot in load_latest_prices(db).values()]
+        finally:
+            db.close()
+
+    @staticmethod
+    async def _watch(interval: float):
+        # Punto de partida: lo que ya está en BD no se reenvía (llega en el snapshot)
+        PriceBroadcaster._unsent(await run_in_threadpool(PriceBroadcaster._load_latest))
+        PriceBroadcaster._alert_cursor = await run_in_threadpool(PriceBroadcaster._last_alert_event_id)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Los disparos se siguen siempre (un seek por id) para no acumular atraso
+                events = await run_in_threadpool(PriceBroadcaster._load_alert_events, PriceBroadcaster._alert_cursor)
+                PriceBroadcaster._publish_new_alerts(events)
+                if PriceBroadcaster.subscriber_count():
+                    PriceBroadcaster.publish_ticks(await run_in_threadpool(PriceBroadcaster._load_latest))
+            except Exception as e:
+                logger.error(f"Error polling prices for stream: {str(e)}")
+
+    @staticmethod
+    def start_watcher():
+        """Inicia el watcher de BD en el event loop actual (startup de la API)."""
+        interval = settings.price_stream_poll_seconds
+        if interval > 0 and (PriceBroadcaster._watcher is None or PriceBroadcaster._watcher.done()):
+            PriceBroadcaster._watcher = asyncio.ensure_future(PriceBroadcaster._watch(interval))
+
+    @staticmethod
+    async def stop_watcher():
+        task, PriceBroadcaster._watcher = PriceBroadcaster._watcher, None
+        PriceBroadcaster._alerts_sent.clear()
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
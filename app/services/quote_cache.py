@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class QuoteCache:
+    """
+    Caché LRU en memoria de cotizaciones de /budgets/generate.
+    La clave es (versión del snapshot de precios, parámetros normalizados):
+    un precio nuevo cambia la versión, así ninguna cotización vieja vuelve a
+    coincidir. Al avanzar la versión se vacía la caché en lugar de esperar a
+    que el LRU expulse las entradas obsoletas.
+    """
+
+    _entries: OrderedDict = OrderedDict()
+    _version = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.quote_cache_size > 0
+
+    @staticmethod
+    def make_key(version: int, params: dict) -> tuple:
+        """Normaliza los parámetros: textos en minúsculas, números como float, orden fijo."""
+        normalized = []
+        for name in sorted(params):
+            value = params[name]
+            if isinstance(value, str):
+                value = value.strip().lower()
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = float(value)
+            normalized.append((name, value))
+        return version, tuple(normalized)
+
+    @staticmethod
+    def get(key: tuple):
+        with QuoteCache._lock:
+            if key[0] != QuoteCache._version:
+                QuoteCache._entries.clear()
+                QuoteCache._version = key[0]
+                return None
+            value = QuoteCache._entries.get(key)
+            if value is not None:
+                QuoteCache._entries.move_to_end(key)
+            return value
+
+    @staticmethod
+    def put(key: tuple, value):
+        if not QuoteCache.enabled():
+            return
+        with QuoteCache._lock:
+            if key[0] != QuoteCache._version:
+                # Llegó un precio nuevo mientras se calculaba: la cotización ya es vieja
+                return
+            QuoteCache._entries[key] = value
+            QuoteCache._entries.move_to_end(key)
+            while len(QuoteCache._entries) > settings.quote_cache_size:
+                QuoteCache._entries.popitem(last=False)
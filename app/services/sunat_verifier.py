@@ -1,11 +1,52 @@
+import asyncio
+from typing import Optional
+import httpx
 import requests
 from bs4 import BeautifulSoup
+from app.models.buyer import BuyerStatus
 from app.utils.logger import AuditLog, logger
 from app.config import get_settings
 
 settings = get_settings()
 
+# Cabeceras de las consultas a SUNAT
+SUNAT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Linux; Android 10; rv:91.0) Gecko/20100101 Firefox/91.0"
+}
+
 class SUNATVerifier:
+    # Cliente HTTP compartido (keep-alive) para verificaciones concurrentes
+    _async_client: Optional[httpx.AsyncClient] = None
+
+    @staticmethod
+    def _result(ruc: str, status_code: int) -> dict:
+        if status_code == 200:
+            # Parsear respuesta (varía según endpoint)
+            return {"ruc": ruc, "active": True, "verified": True, "source": "SUNAT"}
+        return {
+            "ruc": ruc, "active": False, "verified": False, "error": f"Status {status_code}",
+            # 5xx y 429 son fallas del servicio, no una respuesta sobre el RUC
+            "retryable": status_code >= 500 or status_code == 429,
+        }
+
+    @staticmethod
+    def _error_result(ruc: str, error: str) -> dict:
+        # Timeout, DNS, conexión rechazada...: no se pudo verificar
+        return {"ruc": ruc, "active": False, "verified": False, "error": error, "retryable": True}
+
+    @staticmethod
+    def status_update(buyer_id: int, verification: dict) -> Optional[dict]:
+        """
+        Estado a guardar según el resultado (mismo criterio que /buyers/{id}/verify).
+        None si SUNAT no respondió: no hay estado nuevo que guardar y, sin
+        verification_date, el comprador sigue al frente de la re-verificación.
+        """
+        if verification.get("retryable"):
+            return None
+        if verification.get("verified"):
+            return {"id": buyer_id, "status": BuyerStatus.VERIFIED, "risk_notes": None}
+        return {"id": buyer_id, "status": BuyerStatus.SUSPICIOUS, "risk_notes": verification.get("error")}
+
     @staticmethod
     def verify_ruc(ruc: str) -> dict:
         """
@@ -17,31 +58,108 @@ class SUNATVerifier:
             url = f"{settings.sunat_ruc_api}?ruc={ruc}"
             
             # Simulado: reemplazar con API oficial cuando esté disponible
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Linux; Android 10; rv:91.0) Gecko/20100101 Firefox/91.0"
-            }
-            
             # En producción, usar API autorizada de SUNAT o servicio como eFactory
-            response = requests.get(url, headers=headers, timeout=10)
+            response = requests.get(url, headers=SUNAT_HEADERS, timeout=settings.sunat_timeout_seconds)
             
             AuditLog.log_api_call("SUNAT", url, response.status_code)
-            
-            if response.status_code == 200:
-                # Parsear respuesta (varía según endpoint)
-                return {
-                    "ruc": ruc,
-                    "active": True,
-                    "verified": True,
-                    "source": "SUNAT"
-                }
-            else:
-                return {
-                    "ruc": ruc,
-                    "active": False,
-                    "verified": False,
-                    "error": f"Status {response.status_code}"
-                }
+            return SUNATVerifier._result(ruc, response.status_code)
         except Exception as e:
             logger.error(f"Error verifying RUC {ruc}: {str(e)}")
             AuditLog.log_api_call("SUNAT", settings.sunat_ruc_api, error=str(e))
-            return {"ruc": ruc, "active": False, "verified": False, "error": str(e)}
+            return SUNATVerifier._error_result(ruc, str(e))
+
+    @staticmethod
+    def _new_async_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers=SUNAT_HEADERS,
+            limits=httpx.Limits(max_connections=settings.sunat_verify_concurrency, keepalive_expiry=60),
+            # El plazo corre desde que hay conexión: esperar turno en el pool no es un error de SUNAT
+            timeout=httpx.Timeout(settings.sunat_timeout_seconds, pool=None),
+        )
+
+    @staticmethod
+    def get_async_client() -> httpx.AsyncClient:
+        """Devuelve el cliente httpx compartido, creándolo si hace falta."""
+        if SUNATVerifier._async_client is None or SUNATVerifier._async_client.is_closed:
+            SUNATVerifier._async_client = SUNATVerifier._new_async_client()
+        return SUNATVerifier._async_client
+
+    @staticmethod
+    async def close_async_client():
+        if SUNATVerifier._async_client is not None:
+            await SUNATVerifier._async_client.aclose()
+            SUNATVerifier._async_client = None
+
+    @staticmethod
+    async def verify_ruc_async(ruc: str, client: httpx.AsyncClient = None) -> dict:
+        """Versión asíncrona de verify_ruc (mismo resultado)."""
+        url = f"{settings.sunat_ruc_api}?ruc={ruc}"
+        try:
+            client = client or SUNATVerifier.get_async_client()
+            response = await client.get(url)
+            AuditLog.log_api_call("SUNAT", url, response.status_code)
+            return SUNATVerifier._result(ruc, response.status_code)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Error verifying RUC {ruc}: {error}")
+            AuditLog.log_api_call("SUNAT", settings.sunat_ruc_api, error=error)
+            return SUNATVerifier._error_result(ruc, error)
+
+    @staticmethod
+    async def verify_many(items, concurrency: int = None, client: httpx.AsyncClient = None, rate_per_second: float = None):
+        """
+        Verifica muchos RUC con a lo sumo 'concurrency' consultas en curso y,
+        si se indica, no más de 'rate_per_second' consultas iniciadas por segundo.
+        items: iterable de (clave, ruc). Produce (clave, resultado) a medida que
+        terminan, no en el orden de entrada. Un grupo fijo de workers consume el
+        iterable, así la memoria no crece con el número de RUC. La concurrencia
+        no pasa del tamaño del pool de conexiones (SUNAT_VERIFY_CONCURRENCY).
+        """
+        concurrency = min(concurrency or settings.sunat_verify_concurrency, settings.sunat_verify_concurrency)
+        iterator = iter(items)
+        results = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        interval = 1 / rate_per_second if rate_per_second else 0
+        next_start = loop.time()
+
+        async def throttle():
+            # Reserva el próximo turno libre; los turnos quedan espaciados por 'interval'
+            nonlocal next_start
+            now = loop.time()
+            start = max(now, next_start)
+            next_start = start + interval
+            if start > now:
+                await asyncio.sleep(start - now)
+
+        async def worker():
+            try:
+                for key, ruc in iterator:
+                    await throttle()
+                    await results.put((key, await SUNATVerifier.verify_ruc_async(ruc, client)))
+            finally:
+                await results.put(None)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            running = len(workers)
+            while running:
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                yield item
+        finally:
+            # Si el llamador deja de consumir (cliente desconectado), no seguir consultando
+            for task in workers:
+                task.cancel()
+
+    @staticmethod
+    async def _verify_standalone(items, concurrency: int, rate_per_second: float) -> list:
+        # Fuera del event loop de la API (Celery) se usa un cliente propio del loop temporal
+        async with SUNATVerifier._new_async_client() as client:
+            return [item async for item in SUNATVerifier.verify_many(items, concurrency, client, rate_per_second)]
+
+    @staticmethod
+    def verify_many_sync(items, concurrency: int = None, rate_per_second: float = None) -> list:
+        """Versión bloqueante de verify_many para tareas en segundo plano."""
+        return asyncio.run(SUNATVerifier._verify_standalone(items, concurrency, rate_per_second))
@@ -11,6 +11,11 @@ import anthropic
 import openai
 from datetime import datetime
 from app.config import get_settings
+from app.database import SessionLocal
+from app.crud import budget as crud_budget
+from app.models.price import CommodityType
+from app.services import indicators
+from app.services.budget_calculator import buy_quote, sell_quote, TROY_OZ_PER_KG
 from app.utils.logger import logger
 
 settings = get_settings()
@@ -20,6 +25,19 @@ claude_client = anthropic.Anthropic(api_key=settings.claude_api_key)
 openai.api_key = settings.openai_api_key
 
 
+def _save_budget(fields: Dict[str, Any]) -> Optional[int]:
+    """Guarda el presupuesto calculado por un agente; una falla no invalida el cálculo."""
+    db = SessionLocal()
+    try:
+        return crud_budget.create_budget(db, **fields).id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error saving budget: {str(e)}")
+        return None
+    finally:
+        db.close()
+
+
 class TaskType(str, Enum):
     """Tipos de tareas que pueden ejecutar los agentes"""
     SEARCH_BUYERS = "search_buyers"
@@ -244,35 +262,49 @@ class BudgetBuyAgent:
         logger.info(f"💰 Generando presupuesto de COMPRA para {weight}kg de {mineral}")
         
         # Cálculos
-        usable_weight = weight * (law / 100) * (recovery / 100)
-        price_per_kg = (price_usd_oz / 31.1035) * fx_rate
-        gross_cost = usable_weight * price_per_kg
-        commission_cost = gross_cost * (commission / 100)
-        subtotal = gross_cost - freight - commission_cost
-        igv = subtotal * 0.18
-        total = subtotal + igv
+        quoted = buy_quote(weight, law, recovery, price_usd_oz, fx_rate, freight, commission)
+        gross_cost = quoted["gross_cost_pen"]
+        subtotal = quoted["subtotal_pen"]
+        total = quoted["total_pen"]
+        
+        calculations = {
+            "weight_kg": weight,
+            "law_percentage": law,
+            "recovery_percentage": recovery,
+            "usable_weight_kg": round(quoted["usable_weight_kg"], 4),
+            "price_usd_oz": price_usd_oz,
+            "price_per_kg_pen": round(quoted["price_per_kg_pen"], 2),
+            "gross_cost_pen": round(gross_cost, 2),
+            "freight_deduction_pen": round(freight, 2),
+            "commission_percentage": commission,
+            "commission_cost_pen": round(quoted["commission_cost_pen"], 2),
+            "subtotal_pen": round(subtotal, 2),
+            "igv_pen": round(quoted["igv_pen"], 2),
+            "total_pen": round(total, 2),
+            "fx_rate": fx_rate
+        }
+        budget_id = await asyncio.to_thread(_save_budget, {
+            "buyer_id": parameters.get("buyer_id"),
+            "mineral_type": str(mineral).lower(),
+            "quantity_kg": weight,
+            "law_percentage": law,
+            "recovery_percentage": recovery,
+            "base_price_usd": gross_cost / fx_rate if fx_rate else None,
+            "fx_rate": fx_rate,
+            "freight_cost_pen": freight,
+            "taxes_percentage": 18.0,
+            "total_amount_pen": total,
+            "net_amount_pen": subtotal,
+            "details_json": {"type": "buy", **calculations},
+        })
         
         return {
             "success": True,
             "agent": "BudgetBuyAgent",
             "type": "COMPRA",
             "mineral": mineral,
-            "calculations": {
-                "weight_kg": weight,
-                "law_percentage": law,
-                "recovery_percentage": recovery,
-                "usable_weight_kg": round(usable_weight, 4),
-                "price_usd_oz": price_usd_oz,
-                "price_per_kg_pen": round(price_per_kg, 2),
-                "gross_cost_pen": round(gross_cost, 2),
-                "freight_deduction_pen": round(freight, 2),
-                "commission_percentage": commission,
-                "commission_cost_pen": round(commission_cost, 2),
-                "subtotal_pen": round(subtotal, 2),
-                "igv_pen": round(igv, 2),
-                "total_pen": round(total, 2),
-                "fx_rate": fx_rate
-            },
+            "budget_id": budget_id,
+            "calculations": calculations,
             "summary": {
                 "you_pay": round(total, 2),
                 "currency": "PEN"
@@ -320,34 +352,48 @@ class BudgetSellAgent:
         logger.info(f"💸 Generando presupuesto de VENTA para {weight}kg de {mineral}")
         
         # Cálculos
-        usable_weight = weight * (law / 100) * (recovery / 100)
-        price_per_kg = (price_usd_oz / 31.1035) * fx_rate
-        gross_income = usable_weight * price_per_kg
-        intermediary_cost = gross_income * (intermediary / 100)
-        taxes_cost = gross_income * (taxes / 100)
-        net_income = gross_income - transport - intermediary_cost - taxes_cost
+        quoted = sell_quote(weight, law, recovery, price_usd_oz, fx_rate, transport, intermediary, taxes)
+        gross_income = quoted["gross_income_pen"]
+        net_income = quoted["net_income_pen"]
+        
+        calculations = {
+            "weight_kg": weight,
+            "law_percentage": law,
+            "recovery_percentage": recovery,
+            "usable_weight_kg": round(quoted["usable_weight_kg"], 4),
+            "price_usd_oz": price_usd_oz,
+            "price_per_kg_pen": round(quoted["price_per_kg_pen"], 2),
+            "gross_income_pen": round(gross_income, 2),
+            "transport_deduction_pen": round(transport, 2),
+            "intermediary_percentage": intermediary,
+            "intermediary_cost_pen": round(quoted["intermediary_cost_pen"], 2),
+            "taxes_percentage": taxes,
+            "taxes_cost_pen": round(quoted["taxes_cost_pen"], 2),
+            "net_income_pen": round(net_income, 2),
+            "fx_rate": fx_rate
+        }
+        budget_id = await asyncio.to_thread(_save_budget, {
+            "buyer_id": parameters.get("buyer_id"),
+            "mineral_type": str(mineral).lower(),
+            "quantity_kg": weight,
+            "law_percentage": law,
+            "recovery_percentage": recovery,
+            "base_price_usd": gross_income / fx_rate if fx_rate else None,
+            "fx_rate": fx_rate,
+            "freight_cost_pen": transport,
+            "taxes_percentage": taxes,
+            "total_amount_pen": net_income,
+            "net_amount_pen": net_income,
+            "details_json": {"type": "sell", **calculations},
+        })
         
         return {
             "success": True,
             "agent": "BudgetSellAgent",
             "type": "VENTA",
             "mineral": mineral,
-            "calculations": {
-                "weight_kg": weight,
-                "law_percentage": law,
-                "recovery_percentage": recovery,
-                "usable_weight_kg": round(usable_weight, 4),
-                "price_usd_oz": price_usd_oz,
-                "price_per_kg_pen": round(price_per_kg, 2),
-                "gross_income_pen": round(gross_income, 2),
-                "transport_deduction_pen": round(transport, 2),
-                "intermediary_percentage": intermediary,
-                "intermediary_cost_pen": round(intermediary_cost, 2),
-                "taxes_percentage": taxes,
-                "taxes_cost_pen": round(taxes_cost, 2),
-                "net_income_pen": round(net_income, 2),
-                "fx_rate": fx_rate
-            },
+            "budget_id": budget_id,
+            "calculations": calculations,
             "summary": {
                 "you_receive": round(net_income, 2),
                 "currency": "PEN"
@@ -417,32 +463,47 @@ class CompanyVerificationAgent:
 
 class PriceAnalysisAgent:
     """Agente para análisis de precios"""
-    
+
+    # Factor troy oz -> kg usado en la respuesta
+    OZ_PER_KG = TROY_OZ_PER_KG
+
+    @staticmethod
+    def _compute(mineral: str) -> Dict[str, Any]:
+        try:
+            commodity = CommodityType(mineral)
+        except ValueError:
+            return {}
+        db = SessionLocal()
+        try:
+            return indicators.analyze(db, [commodity])
+        finally:
+            db.close()
+
     @staticmethod
     async def execute(parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Analiza precios de minerales"""
-        mineral = parameters.get("mineral_type", "oro")
+        """Analiza precios de minerales con indicadores calculados sobre el histórico"""
+        mineral = parameters.get("mineral_type", "oro").lower()
         
         logger.info(f"💹 Analizando precios de {mineral}")
         
-        # Precios de referencia
-        prices = {
-            "oro": {"usd_oz": 2050, "trend": "al alza"},
-            "plata": {"usd_oz": 24.50, "trend": "estable"},
-            "cobre": {"usd_oz": 4.20, "trend": "al alza"}
-        }
-        
-        mineral_price = prices.get(mineral.lower(), {"usd_oz": 0, "trend": "desconocido"})
+        results = await asyncio.to_thread(PriceAnalysisAgent._compute, mineral)
+        analysis = results.get(mineral, {"points": 0, "trend": "desconocido"})
+        last = analysis.get("last")
         
         return {
             "success": True,
             "agent": "PriceAnalysisAgent",
             "mineral": mineral,
             "prices": {
-                "usd_per_oz": mineral_price["usd_oz"],
-                "usd_per_kg": round(mineral_price["usd_oz"] * 32.151, 2),
-                "trend": mineral_price["trend"],
-                "updated_at": datetime.now().isoformat()
+                "usd_per_oz": last,
+                "usd_per_kg": round(last * PriceAnalysisAgent.OZ_PER_KG, 2) if last is not None else None,
+                "pen_per_oz": analysis.get("last_pen"),
+                "trend": analysis["trend"],
+                "updated_at": analysis["to"].isoformat() if analysis.get("to") else None
+            },
+            "indicators": {
+                key: value for key, value in analysis.items()
+                if key not in ("from", "to", "last", "last_pen", "trend")
             }
         }
 
@@ -1,9 +1,13 @@
+from datetime import datetime, timedelta
 from celery import Celery
 from celery.schedules import crontab
 from app.config import get_settings
+from app.crud.price import compact_prices
+from app.crud.buyer import get_stale_buyers, update_buyer_statuses_bulk
 from app.database import SessionLocal
 from app.services.price_fetcher import PriceFetcher
 from app.services.scraper import CompanyScraperScraper
+from app.services.sunat_verifier import SUNATVerifier
 from app.utils.logger import logger
 
 settings = get_settings()
@@ -19,6 +23,14 @@ app.conf.beat_schedule = {
         'task': 'app.tasks.celery_tasks.search_buyers',
         'schedule': crontab(day_of_week=0, hour=10, minute=0),  # Domingos 10 AM
     },
+    'compact-prices-daily': {
+        'task': 'app.tasks.celery_tasks.compact_price_history',
+        'schedule': crontab(hour=3, minute=30),  # 3:30 AM diariamente
+    },
+    'reverify-buyers': {
+        'task': 'app.tasks.celery_tasks.reverify_stale_buyers',
+        'schedule': crontab(minute='*/30'),  # cada 30 minutos, un lote acotado
+    },
 }
 
 @app.task
@@ -44,3 +56,55 @@ def search_buyers():
     except Exception as e:
         logger.error(f"Error searching buyers: {str(e)}")
         return {"status": "error", "message": str(e)}
+
+
+@app.task
+def compact_price_history():
+    """Tarea programada: aplicar retención y compactación a la tabla de precios."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        deleted = compact_prices(
+            db,
+            raw_before=now - timedelta(days=settings.price_raw_retention_days),
+            minute_before=now - timedelta(days=settings.price_minute_rollup_retention_days),
+            hour_before=now - timedelta(days=settings.price_hourly_rollup_retention_days),
+            batch_size=settings.price_compaction_batch_size,
+        )
+        logger.info(f"Compactación de precios: {deleted}")
+        return {"status": "success", "deleted": deleted}
+    except Exception as e:
+        logger.error(f"Error compacting prices: {str(e)}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
+@app.task
+def reverify_stale_buyers():
+    """
+    Tarea programada: re-verifica en SUNAT un lote de compradores con la
+    verificación vencida (los más antiguos primero), a ritmo limitado.
+    """
+    db = SessionLocal()
+    try:
+        stale_before = datetime.utcnow() - timedelta(hours=settings.verification_ttl_hours)
+        targets = get_stale_buyers(db, stale_before, settings.reverify_batch_size)
+        if not targets:
+            return {"status": "success", "verified": 0}
+        results = SUNATVerifier.verify_many_sync(
+            targets,
+            concurrency=settings.sunat_verify_concurrency,
+            rate_per_second=settings.reverify_rate_per_second,
+        )
+        updates = [SUNATVerifier.status_update(buyer_id, verification) for buyer_id, verification in results]
+        # Los que SUNAT no respondió conservan su verification_date y encabezan el próximo lote
+        updated = update_buyer_statuses_bulk(db, [update for update in updates if update is not None])
+        failed = len(updates) - updated
+        logger.info(f"Re-verificación de compradores: {updated} (sin respuesta de SUNAT: {failed})")
+        return {"status": "success", "verified": updated, "failed": failed}
+    except Exception as e:
+        logger.error(f"Error re-verifying buyers: {str(e)}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
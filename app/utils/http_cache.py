@@ -0,0 +1,28 @@
+"""
+Respuestas JSON con ETag: el cliente reenvía el ETag en If-None-Match y, si
+el contenido no cambió, recibe 304 sin cuerpo.
+"""
+
+import hashlib
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Comparación débil (RFC 9110): W/"x" coincide con "x"
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def etag_json_response(request: Request, content, headers: dict = None) -> Response:
+    """Serializa 'content', calcula el ETag del cuerpo y responde 304 si coincide."""
+    response = JSONResponse(jsonable_encoder(content), headers=headers)
+    etag = '"' + hashlib.sha1(response.body).hexdigest() + '"'
+    response_headers = {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+    response.headers.update(response_headers)
+    return response
@@ -0,0 +1,35 @@
+"""
+Cursores opacos para paginación keyset: codifican la clave de la última fila
+devuelta (p.ej. (created_at, id)) en base64 url-safe.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Devuelve la lista de valores; las fechas vuelven como cadenas ISO. ValueError si es inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Cursor no válido")
+    if not isinstance(values, list):
+        raise ValueError("Cursor no válido")
+    return values
+
+
+def decode_datetime_cursor(cursor: str):
+    """Cursor (datetime ISO, id) -> (datetime, int)."""
+    values = decode_cursor(cursor)
+    try:
+        stamp, row_id = values
+        return datetime.fromisoformat(stamp), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError("Cursor no válido")
@@ -0,0 +1,15 @@
+from fastapi import Request
+
+
+async def iter_request_lines(request: Request, encoding: str = "utf-8"):
+    """Itera las líneas del cuerpo de la petición a medida que llegan, sin cargarlo completo."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line:
+                yield line.decode(encoding)
+    if buffer.strip():
+        yield buffer.rstrip(b"\r").decode(encoding)
@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def to_epoch(ts: datetime) -> float:
+    """Convierte un datetime naive en UTC (como fetched_at) a segundos epoch."""
+    return ts.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TickRing:
+    """
+    Buffer circular de capacidad fija con pares (timestamp, precio) en float64.
+    Cada muestra se escribe dos veces (posición i e i + capacidad), así las
+    últimas N muestras siempre forman un slice contiguo y last() devuelve
+    vistas NumPy sin copiar. Las vistas son válidas hasta el siguiente append.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._ts = np.zeros(2 * capacity, dtype=np.float64)
+        self._px = np.zeros(2 * capacity, dtype=np.float64)
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def last_timestamp(self) -> float:
+        return self._ts[self._next + self.capacity - 1] if self._size else float("-inf")
+
+    def append(self, ts: float, price: float) -> bool:
+        """Agrega una muestra; ignora las que no son más recientes que la última."""
+        with self._lock:
+            if ts < self.last_timestamp:
+                return False
+            i = self._next
+            self._ts[i] = self._ts[i + self.capacity] = ts
+            self._px[i] = self._px[i + self.capacity] = price
+            self._next = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            return True
+
+    def last(self, n: int = None):
+        """Vistas de solo lectura (timestamps, precios) de las últimas n muestras."""
+        with self._lock:
+            n = self._size if n is None else max(0, min(n, self._size))
+            end = self._next + self.capacity
+            ts = self._ts[end - n:end]
+            px = self._px[end - n:end]
+        ts.flags.writeable = False
+        px.flags.writeable = False
+        return ts, px
+
+
+class TickStore:
+    """Ticks recientes por CommodityType en memoria, sin ORM ni consultas a BD."""
+
+    _rings: dict = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.tick_store_capacity > 0
+
+    @staticmethod
+    def ring(commodity) -> TickRing:
+        ring = TickStore._rings.get(commodity)
+        if ring is None:
+            with TickStore._lock:
+                ring = TickStore._rings.setdefault(commodity, TickRing(settings.tick_store_capacity))
+        return ring
+
+    @staticmethod
+    def append(commodity, fetched_at: datetime, price: float):
+        if TickStore.enabled() and price is not None:
+            TickStore.ring(commodity).append(to_epoch(fetched_at), float(price))
+
+    @staticmethod
+    def last(commodity, n: int = None):
+        """Últimas n muestras (timestamps epoch, precios) como vistas NumPy."""
+        if not TickStore.enabled():
+            empty = np.empty(0, dtype=np.float64)
+            return empty, empty
+        return TickStore.ring(commodity).last(n)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del núcleo de presupuestos (app/services/budget_calculator.py):
+cotizaciones por segundo por la entrada escalar y por columnas.
+Los valores de referencia se verifican en tests/test_budget_calculator.py.
+
+Uso:
+    python benchmark_budgets.py
+    python benchmark_budgets.py --rows 1000000 --repeat 3
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from app.services.budget_calculator import (
+    quote, quote_columns, buy_quote, buy_columns, sell_quote, sell_columns,
+)
+
+# Entradas representativas por núcleo (mismo orden de argumentos que la entrada escalar)
+KERNELS = {
+    "generate": (quote, quote_columns, (250.0, 62.5, 88.0, 2412.37, 3.7821, 4.5, 1250.0, 18.0)),
+    "buy": (buy_quote, buy_columns, (150.0, 72.3, 89.5, 2387.15, 3.7764, 450.0, 2.5)),
+    "sell": (sell_quote, sell_columns, (150.0, 72.3, 89.5, 2387.15, 3.7764, 380.0, 1.5, 4.0)),
+}
+
+
+def _rate(seconds: float, quotes: int) -> str:
+    return f"{quotes / seconds:>14,.0f} cotizaciones/s"
+
+
+def run_benchmark(rows: int, repeat: int):
+    rng = np.random.default_rng(0)
+    print(f"⏱️  Microbenchmark (mejor de {repeat} repeticiones)")
+    for name, (scalar_fn, columns_fn, args) in KERNELS.items():
+        loops = 20000
+        best = min(timeit.repeat(lambda: scalar_fn(*args), number=loops, repeat=repeat))
+        print(f"  {name:<9} escalar          {_rate(best, loops)}")
+
+        # Columnas: cada parámetro variado +-10% alrededor del caso representativo
+        columns = [value * rng.uniform(0.9, 1.1, rows) for value in args]
+        best = min(timeit.repeat(lambda: columns_fn(*columns), number=10, repeat=repeat)) / 10
+        print(f"  {name:<9} columnas x{rows:<6} {_rate(best, rows)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del núcleo de presupuestos")
+    parser.add_argument("--rows", type=int, default=100_000, help="filas del benchmark por columnas")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
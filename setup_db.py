@@ -79,6 +79,17 @@ def create_sample_data():
     finally:
         db.close()
 
+def backfill_rollups():
+    """Reconstruye price_rollups desde el histórico crudo (una vez, no en cada arranque)."""
+    from app.crud.price import backfill_price_rollups
+    db = SessionLocal()
+    try:
+        rebuilt = backfill_price_rollups(db)
+        if rebuilt:
+            print(f"📊 Agregados de precios reconstruidos: {rebuilt} días")
+    finally:
+        db.close()
+
 def main():
     settings = get_settings()
     
@@ -106,6 +117,9 @@ def main():
         # Inicializar BD
         init_db()
         
+        # Agregados OHLC del histórico anterior a price_rollups (solo días faltantes)
+        backfill_rollups()
+        
         # Crear datos de ejemplo
         create_sample_data()
         
@@ -0,0 +1,7 @@
+import os
+
+# Settings exige credenciales de las APIs de IA: las pruebas no las usan.
+# La BD por defecto es SQLite en memoria para no tocar mineral_agent.db.
+for name in ("GEMINI_API_KEY", "CLAUDE_API_KEY", "CLAUDE_MODEL", "OPENAI_API_KEY", "OPENAI_MODEL", "SECRET_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
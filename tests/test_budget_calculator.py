@@ -0,0 +1,80 @@
+"""
+Valores de referencia del núcleo de presupuestos (app/services/budget_calculator.py).
+
+Se obtuvieron con las fórmulas originales de /budgets/generate, BudgetBuyAgent
+y BudgetSellAgent; cualquier cambio del núcleo debe reproducirlos exactamente,
+por la entrada escalar y por columnas.
+"""
+
+import numpy as np
+import pytest
+
+from app.services.budget_calculator import (
+    quote, quote_columns, buy_quote, buy_columns, sell_quote, sell_columns,
+    sweep, SWEEP_AXES, SWEEP_MODES, SWEEP_PARAMS,
+)
+
+# (quantity_kg, law, recovery, metal_price, fx_rate, discounts %, freight_pen, taxes %)
+GENERATE_CASES = [
+    ((1.0, 90.0, 95.0, 2000.0, 3.7, 0.0, 0.0, 18.0), {'usable_kg': 0.855, 'base_price_usd': 1710.0, 'base_price_pen': 6327.0, 'discounted_price': 6327.0, 'net_before_tax': 6327.0, 'taxes': 1138.86, 'final_amount': 7465.86}),
+    ((250.0, 62.5, 88.0, 2412.37, 3.7821, 4.5, 1250.0, 18.0), {'usable_kg': 137.5, 'base_price_usd': 331700.875, 'base_price_pen': 1254525.8793374998, 'discounted_price': 1198072.2147673124, 'net_before_tax': 1199322.2147673124, 'taxes': 215877.99865811624, 'final_amount': 1415200.2134254286}),
+    ((0.0, 100.0, 95.0, 1900.0, 3.65, 0.0, 0.0, 18.0), {'usable_kg': 0.0, 'base_price_usd': 0.0, 'base_price_pen': 0.0, 'discounted_price': 0.0, 'net_before_tax': 0.0, 'taxes': 0.0, 'final_amount': 0.0}),
+    ((12.75, 35.2, 91.0, 28.44, 3.802, 2.0, 80.0, 0.0), {'usable_kg': 4.08408, 'base_price_usd': 116.15123520000002, 'base_price_pen': 441.60699623040006, 'discounted_price': 432.77485630579207, 'net_before_tax': 512.7748563057921, 'taxes': 0.0, 'final_amount': 512.7748563057921}),
+]
+
+# (weight_kg, law, recovery, price_usd_oz, fx_rate, freight_cost, commission %)
+BUY_CASES = [
+    ((2.0, 100.0, 95.0, 2000.0, 3.7, 0.0, 3.0), {'usable_weight_kg': 1.9, 'price_per_kg_pen': 237.91534714742713, 'gross_cost_pen': 452.0391595801115, 'commission_cost_pen': 13.561174787403345, 'subtotal_pen': 438.4779847927082, 'igv_pen': 78.92603726268747, 'total_pen': 517.4040220553957}),
+    ((150.0, 72.3, 89.5, 2387.15, 3.7764, 450.0, 2.5), {'usable_weight_kg': 97.06275000000001, 'price_per_kg_pen': 289.83340331473954, 'gross_cost_pen': 28132.027167587737, 'commission_cost_pen': 703.3006791896935, 'subtotal_pen': 26978.726488398042, 'igv_pen': 4856.170767911647, 'total_pen': 31834.89725630969}),
+    ((0.5, 15.0, 80.0, 4.12, 3.69, 0.0, 3.0), {'usable_weight_kg': 0.06, 'price_per_kg_pen': 0.48878100535309527, 'gross_cost_pen': 0.029326860321185713, 'commission_cost_pen': 0.0008798058096355714, 'subtotal_pen': 0.028447054511550142, 'igv_pen': 0.0051204698120790254, 'total_pen': 0.033567524323629166}),
+]
+
+# (weight_kg, law, recovery, price_usd_oz, fx_rate, transport_cost, intermediary %, taxes %)
+SELL_CASES = [
+    ((2.0, 100.0, 95.0, 2000.0, 3.7, 100.0, 2.0, 5.0), {'usable_weight_kg': 1.9, 'price_per_kg_pen': 237.91534714742713, 'gross_income_pen': 452.0391595801115, 'intermediary_cost_pen': 9.04078319160223, 'taxes_cost_pen': 22.601957979005576, 'net_income_pen': 320.3964184095037}),
+    ((150.0, 72.3, 89.5, 2387.15, 3.7764, 380.0, 1.5, 4.0), {'usable_weight_kg': 97.06275000000001, 'price_per_kg_pen': 289.83340331473954, 'gross_income_pen': 28132.027167587737, 'intermediary_cost_pen': 421.98040751381603, 'taxes_cost_pen': 1125.2810867035096, 'net_income_pen': 26204.765673370413}),
+    ((10.0, 80.0, 95.0, 27.9, 3.71, 100.0, 2.0, 5.0), {'usable_weight_kg': 7.6, 'price_per_kg_pen': 3.327889144308518, 'gross_income_pen': 25.291957496744736, 'intermediary_cost_pen': 0.5058391499348948, 'taxes_cost_pen': 1.2645978748372368, 'net_income_pen': -76.47847952802739}),
+]
+
+KERNELS = {
+    "generate": (quote, quote_columns, GENERATE_CASES),
+    "buy": (buy_quote, buy_columns, BUY_CASES),
+    "sell": (sell_quote, sell_columns, SELL_CASES),
+}
+
+SCALAR_CASES = [
+    pytest.param(name, i, id=f"{name}[{i}]")
+    for name, (_, _, cases) in KERNELS.items()
+    for i in range(len(cases))
+]
+
+
+@pytest.mark.parametrize("name, i", SCALAR_CASES)
+def test_scalar_matches_golden(name, i):
+    scalar_fn, _, cases = KERNELS[name]
+    args, expected = cases[i]
+    got = scalar_fn(*args)
+    assert {field: got[field] for field in expected} == expected
+
+
+@pytest.mark.parametrize("name", list(KERNELS))
+def test_columns_match_golden(name):
+    # Todos los casos como una sola columna por parámetro
+    _, columns_fn, cases = KERNELS[name]
+    columns = columns_fn(*(np.array(column) for column in zip(*(args for args, _ in cases))))
+    for i, (_, expected) in enumerate(cases):
+        assert {field: columns[field][i] for field in expected} == expected, f"{name}[{i}]"
+
+
+@pytest.mark.parametrize("mode", list(SWEEP_MODES))
+def test_sweep_params_match_kernel_arguments(mode):
+    # Una celda por eje con los argumentos del caso de referencia: SWEEP_PARAMS
+    # nombra, en orden, los argumentos del núcleo que no son ejes
+    _, _, cases = KERNELS[mode]
+    args, expected = cases[1]
+    required, optional = SWEEP_PARAMS[mode]
+    params = dict(zip(required + optional, (args[0],) + args[5:]))
+    axes = {name: np.array([value]) for name, value in zip(SWEEP_AXES, args[1:5])}
+    _, amount_name = SWEEP_MODES[mode]
+    field = {"total_amount_pen": "final_amount"}.get(amount_name, amount_name)
+    assert sweep(mode, axes, params)["grid"].item() == expected[field]
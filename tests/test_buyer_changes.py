@@ -0,0 +1,81 @@
+"""
+Feed de cambios de compradores (crud.buyer.get_buyer_changes): al paginar con
+el cursor (updated_at, id) no se pierden filas que comparten el mismo
+updated_at, sea cual sea la vía de escritura.
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.buyer import Buyer, BuyerStatus
+from app.crud import buyer as crud_buyer
+
+BUYER_COUNT = 30
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _rows(count=BUYER_COUNT):
+    return [
+        {
+            "ruc": f"20{index:09d}", "name": f"Comprador {index}", "address": "Trujillo",
+            "phone": "044000000", "email": f"c{index}@example.pe", "classification": "minería",
+        }
+        for index in range(count)
+    ]
+
+
+def _all_changes(db, limit=10):
+    seen, after = [], None
+    while True:
+        rows, has_more = crud_buyer.get_buyer_changes(db, after, limit, lag_seconds=0)
+        seen.extend(row["id"] for row in rows)
+        if not has_more:
+            return seen
+        after = (rows[-1]["updated_at"], rows[-1]["id"])
+
+
+def _upsert_again(db):
+    # Un solo lote ON CONFLICT: todas las filas reciben el mismo updated_at
+    crud_buyer.upsert_buyers(db, _rows())
+
+
+def _bulk_status(db):
+    ids = [buyer_id for buyer_id, _ in crud_buyer.get_buyers_to_verify(db)]
+    crud_buyer.update_buyer_statuses_bulk(db, [
+        {"id": buyer_id, "status": BuyerStatus.VERIFIED, "risk_notes": None} for buyer_id in ids
+    ])
+
+
+@pytest.mark.parametrize("rewrite", [_upsert_again, _bulk_status])
+def test_changes_page_through_rows_sharing_updated_at(db, rewrite):
+    crud_buyer.upsert_buyers(db, _rows())
+    rewrite(db)
+    assert len({row[0] for row in db.query(Buyer.updated_at)}) == 1
+
+    seen = _all_changes(db)
+    assert sorted(seen) == sorted(row[0] for row in db.query(Buyer.id))
+    assert len(seen) == BUYER_COUNT
+
+
+def test_legacy_timestamps_are_normalized(db):
+    crud_buyer.upsert_buyers(db, _rows())
+    # Filas anteriores escritas por CURRENT_TIMESTAMP, todas en el mismo segundo
+    db.execute(text("UPDATE buyers SET updated_at = '2024-01-01 12:00:00'"))
+    db.commit()
+
+    crud_buyer.normalize_buyer_timestamps(db.get_bind())
+    assert len(_all_changes(db)) == BUYER_COUNT
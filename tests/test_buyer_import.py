@@ -0,0 +1,51 @@
+"""
+Importación de compradores (crud.buyer.parse_buyer_records + upsert_buyers):
+re-importar un RUC con solo algunas columnas actualiza esas y conserva el resto.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.buyer import Buyer
+from app.crud import buyer as crud_buyer
+
+FULL_ROW = {
+    "ruc": "20123456789", "name": "Minera Trujillo", "address": "Av. España 123",
+    "phone": "044111111", "email": "compras@minera.pe", "classification": "minería",
+    "website": "https://minera.pe", "certificates": '["RINSE"]',
+    "latitude": -8.11, "longitude": -79.03,
+}
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _import(db, records):
+    valid, errors = crud_buyer.parse_buyer_records(records)
+    assert errors == []
+    crud_buyer.upsert_buyers(db, [row for _, row in valid])
+
+
+def test_partial_reimport_keeps_missing_columns(db):
+    _import(db, [FULL_ROW])
+    # Solo las columnas obligatorias, con el teléfono cambiado (como en un CSV de contactos)
+    required = {key: FULL_ROW[key] for key in ("ruc", "name", "address", "email", "classification")}
+    _import(db, [{**required, "phone": "044222222", "website": ""}])
+
+    buyer = db.query(Buyer).filter(Buyer.ruc == FULL_ROW["ruc"]).one()
+    assert buyer.phone == "044222222"
+    assert buyer.website == FULL_ROW["website"]
+    assert buyer.certificates == FULL_ROW["certificates"]
+    assert (buyer.latitude, buyer.longitude) == (FULL_ROW["latitude"], FULL_ROW["longitude"])
@@ -0,0 +1,56 @@
+"""
+Búsqueda de compradores (crud.buyer_search): el índice ordena antes de acotar
+los candidatos, y '%' / '_' de la consulta son literales en los LIKE.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.buyer import Buyer
+from app.crud import buyer_search
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    buyer_search.ensure_search_index(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _add(db, names, address="Trujillo"):
+    db.add_all(Buyer(ruc=f"20{len(name):03d}{index:06d}", name=name, address=address) for index, name in enumerate(names))
+    db.commit()
+
+
+def test_fuzzy_best_match_beyond_candidate_cap(db):
+    # Más coincidencias débiles (solo en la dirección) que candidatos, insertadas primero
+    weak = [f"Comercial {index}" for index in range(buyer_search.FUZZY_CANDIDATES + 50)]
+    _add(db, weak, address="Jr. Huamachuco 123")
+    best = Buyer(ruc="20999999999", name="Minera Huamachuco", address="Trujillo")
+    db.add(best)
+    db.commit()
+
+    results = buyer_search.search_buyers(db, "huamachuko", limit=5)
+    assert results[0]["id"] == best.id
+
+
+def test_like_fallback_escapes_wildcards(db):
+    _add(db, ["Lote 50% oro", "Lote 500 oro", "Oro_Norte", "OroXNorte"])
+
+    assert [row["name"] for row in buyer_search._like_candidates(db, "50%", 10, None)] == ["Lote 50% oro"]
+    assert [row["name"] for row in buyer_search._like_candidates(db, "o_n", 10, None)] == ["Oro_Norte"]
+
+
+def test_short_query_prefix_escapes_wildcards(db):
+    _add(db, ["A_B Metales", "AXB Metales"])
+
+    assert [row["name"] for row in buyer_search.search_buyers(db, "a_")] == ["A_B Metales"]